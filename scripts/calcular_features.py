@@ -12,6 +12,7 @@ from pemex_contratos.load_data_proveedores import cargar_padron_proveedores
 from pemex_contratos.load_data_proveedores import cargar_lista_contribuyentes_69b
 from pemex_contratos.load_data_proveedores import cargar_particulares_sancionados
 from pemex_contratos.load_data_proveedores import cargar_proveedores_sancionados
+from pemex_contratos.proyeccion import memoria_maxima_mb
 from pemex_contratos.inai.features_contrato import (
     diferencia_fecha_contrato_fecha_junta,
     diferencia_fecha_junta_fecha_convocatoria,
@@ -152,3 +153,4 @@ if __name__ == "__main__":
         features_all, df_features_contratos, "left", ["numero_contrato", "num_evento"]
     )
     features_all.to_csv(path_output, index=False, quoting=1, encoding="utf-8")
+    print(f"Memoria máxima: {memoria_maxima_mb():.0f} MB")
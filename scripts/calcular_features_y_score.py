@@ -0,0 +1,195 @@
+"""Script que carga todas las fuentes una sola vez, calcula cada feature
+una sola vez y genera a partir de los mismos resultados la tabla con los
+valores de los features (informacion_features.csv) y la tabla de features
+binarios por contrato con el score de riesgo
+(features_binarios_nivel_contrato.csv)"""
+import pandas as pd
+from pemex_contratos.inai.load_data import cargar_todos_procedimientos
+from pemex_contratos.inai.load_data import cargar_tabla_ofertas
+from pemex_contratos.inai.load_data import cargar_tabla_cotizaciones
+from pemex_contratos.inai.load_data import cargar_tabla_asistentes_junta_aclaraciones
+from pemex_contratos.inai.load_data import cargar_tabla_posibles_contratantes
+from pemex_contratos.inai.ofertas import tabla_ofertas
+from pemex_contratos.inai.score import features_binarios_nivel_contrato
+from pemex_contratos.inai.score import score_riesgo
+from pemex_contratos.inai.score import solo_binarios
+from pemex_contratos.load_data_proveedores import cargar_no_localizados
+from pemex_contratos.load_data_proveedores import cargar_padron_proveedores
+from pemex_contratos.load_data_proveedores import cargar_lista_contribuyentes_69b
+from pemex_contratos.load_data_proveedores import cargar_particulares_sancionados
+from pemex_contratos.load_data_proveedores import cargar_proveedores_sancionados
+from pemex_contratos.proyeccion import memoria_maxima_mb
+from pemex_contratos.inai.features_contrato import (
+    con_convenios_modificatorios,
+    periodos_cortos_contratos,
+)
+from pemex_contratos.inai.features_procedimiento import (
+    adjudicaciones_con_una_cotizacion,
+    discrepancia_entre_inai_y_siscep,
+    expediente_en_inai_no_existe_en_siscep,
+    falta_asistencia_junta_aclaraciones,
+    ofertas_unicas_en_licitaciones_e_invitaciones,
+    participacion_baja_en_expediente,
+)
+from pemex_contratos.inai.features_proveedor import (
+    empresa_creada_recientemente,
+    empresa_no_en_padron_proveedores,
+    empresa_no_localizada_sat,
+    market_share,
+    proveedores_y_particulares_sancionados,
+    reportada_como_empresa_fantasma,
+    tasa_exito_proveedor,
+    participacion_conjunta_sospechosa,
+)
+
+
+if __name__ == "__main__":
+    n_contratos = 2029
+    n_expedientes = 1421
+    n_proveedores = 1089
+    # rutas contrataciones
+    base_path_inai = "../data/raw/inai/"
+    path_siscep = "../data/processed/contrataciones_pemex_siscep.csv"
+    # ruatas informacion proveedores
+    path_no_localizados = "../data/raw/No localizados.csv"
+    path_padron = "../data/raw/padron_proveedores/"
+    path_particulares_sancionados = "../data/raw/s3-particulares-sfp.json"
+    path_proveedores_sancionados = "../data/raw/proveedores_sancionados.csv"
+    path_listado = "../data/raw/Listado_Completo_69-B.csv"
+    # rutas finales de los features y del score
+    path_output_features = "../data/features/informacion_features.csv"
+    path_output_score = "../data/features/features_binarios_nivel_contrato.csv"
+
+    # Carga y pipeline de datos
+
+    # contratos del portal de transparencia
+    df_inai = cargar_todos_procedimientos(base_path_inai)
+    # contratos de la página del siscep
+    df_siscep = pd.read_csv(
+        path_siscep,
+        dtype={"montos_maximos_mxn": float, "montos_minimos_mxn": float},
+        parse_dates=[
+            "publicado",
+            "fecha_fallo",
+            "fecha_recepcion_propuestas",
+            "fecha_preguntas_y_respuestas",
+            "fecha_creacion_empresa_rfc",
+        ],
+    )
+    # tablas sobre proveedores y contratistas
+    no_localizados = cargar_no_localizados(path_no_localizados)
+    padron_proveedores = cargar_padron_proveedores(path_padron)
+    particulares_sancionados = cargar_particulares_sancionados(
+        path_particulares_sancionados
+    )
+    proveedores_sancionados = cargar_proveedores_sancionados(
+        path_proveedores_sancionados
+    )
+    fantasma = cargar_lista_contribuyentes_69b(path_listado)
+
+    # Tablas con informacion adicional sobre los contratos
+    df_ofertas = cargar_tabla_ofertas(base_path_inai)
+    df_cotizaciones = cargar_tabla_cotizaciones(base_path_inai)
+    df_asistentes = cargar_tabla_asistentes_junta_aclaraciones(base_path_inai)
+    df_contratantes = cargar_tabla_posibles_contratantes(base_path_inai)
+    # la tabla de ofertas se normaliza una sola vez para los features de
+    # proveedor que la usan
+    ofertas = tabla_ofertas(df_ofertas, df_inai)
+
+    # Features a nivel contrato: las tres duraciones y sus features binarios
+    # salen de una sola pasada sobre la línea de tiempo
+    llaves_contrato = ["num_evento", "numero_contrato"]
+    df_periodos = periodos_cortos_contratos(df_inai)
+    df_convenios = con_convenios_modificatorios(df_inai)
+    dfs = [df_periodos, df_convenios]
+    dfs = [df.set_index(llaves_contrato) for df in dfs]
+    assert all([df.shape[0] == n_contratos for df in dfs])
+    df_features_contratos = pd.concat(dfs, axis=1, ignore_index=False).reset_index()
+    # mismo orden de columnas que las funciones por feature
+    df_features_contratos = df_features_contratos.loc[
+        :,
+        llaves_contrato
+        + [
+            "diferencia_fecha_junta_fecha_convocatoria",
+            "periodo_corto_fecha_junta_fecha_convocatoria",
+            "diferencia_fecha_contrato_fecha_junta",
+            "periodo_corto_fecha_contrato_fecha_junta",
+            "tuvo_convenios_modificatorios",
+            "diferenica_plazo_entrega",
+            "plazo_corto_entrega",
+        ],
+    ]
+
+    # features nivel expediente
+    dfs = [
+        expediente_en_inai_no_existe_en_siscep(df_inai, df_siscep),
+        discrepancia_entre_inai_y_siscep(df_inai, df_siscep),
+        adjudicaciones_con_una_cotizacion(df_inai, df_cotizaciones),
+        falta_asistencia_junta_aclaraciones(df_inai, df_asistentes),
+        ofertas_unicas_en_licitaciones_e_invitaciones(df_inai, df_ofertas),
+        participacion_baja_en_expediente(df_inai, df_contratantes),
+    ]
+    dfs = [df.set_index("num_evento") for df in dfs]
+    assert all([df.shape[0] == n_expedientes for df in dfs])
+    df_features_expedientes = (
+        pd.concat(dfs, axis=1, ignore_index=False)
+        .reset_index()
+        .rename(columns={"index": "num_evento"})
+    )
+
+    # features nivel proveedor
+    dfs = [
+        empresa_no_en_padron_proveedores(df_inai, padron_proveedores),
+        reportada_como_empresa_fantasma(df_inai, fantasma),
+        empresa_no_localizada_sat(df_inai, no_localizados),
+        tasa_exito_proveedor(df_inai, ofertas, 0.5),
+        empresa_creada_recientemente(df_inai),
+        # los dos market share en una sola agrupación
+        market_share(df_inai, tipos=("contratos", "monto")),
+        participacion_conjunta_sospechosa(df_inai, ofertas, 5, 0.5, 0.5),
+        proveedores_y_particulares_sancionados(
+            df_inai, proveedores_sancionados, particulares_sancionados
+        ),
+    ]
+    dfs = [df.set_index("razon_social_simple") for df in dfs]
+    assert all([df.shape[0] == n_proveedores for df in dfs])
+    df_features_empresas = (
+        pd.concat(dfs, axis=1, ignore_index=False)
+        .reset_index()
+        .rename(columns={"index": "razon_social_simple"})
+    )
+
+    # Tabla con los valores de los features: se unen a nivel razon_social,
+    # num_evento y numero_contrato
+    features_all = (
+        df_inai.groupby(["num_evento", "numero_contrato", "razon_social_simple"])
+        .monto.sum()
+        .reset_index()
+    )
+    assert features_all.shape == (2117, 4)
+    features_all = pd.merge(
+        features_all, df_features_empresas, "left", "razon_social_simple"
+    )
+    features_all = pd.merge(features_all, df_features_expedientes, "left", "num_evento")
+    features_all = pd.merge(
+        features_all, df_features_contratos, "left", ["numero_contrato", "num_evento"]
+    )
+    features_all.to_csv(path_output_features, index=False, quoting=1, encoding="utf-8")
+
+    # Score de riesgo con los features binarios de las mismas tablas
+    df_nivel_contrato = features_binarios_nivel_contrato(
+        df_inai,
+        solo_binarios(df_features_empresas, ["razon_social_simple"]),
+        solo_binarios(df_features_expedientes, ["num_evento"]),
+        # misma tabla ordenada que informacion_features.csv, con convenios
+        # antes de plazo_corto_entrega como en calcular_score_riesgo.py
+        solo_binarios(df_features_contratos, llaves_contrato),
+    )
+    assert df_nivel_contrato.shape == (2029, 22)
+    df_nivel_contrato = score_riesgo(df_nivel_contrato)
+    assert df_nivel_contrato.shape == (2029, 25)
+    df_nivel_contrato.to_csv(
+        path_output_score, index=False, quoting=1, encoding="utf-8"
+    )
+    print(f"Memoria máxima: {memoria_maxima_mb():.0f} MB")
+    print("Ejecución terminada.")
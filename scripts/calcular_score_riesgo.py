@@ -1,6 +1,5 @@
 """Script que genera la tabla de features binarios por contrato
 y calcula el score de riesgo para cada uno de ellos"""
-import numpy as np
 import pandas as pd
 from pemex_contratos.inai.load_data import cargar_todos_procedimientos
 from pemex_contratos.inai.load_data import cargar_tabla_ofertas
@@ -10,33 +9,15 @@ from pemex_contratos.inai.load_data import cargar_tabla_posibles_contratantes
 from pemex_contratos.inai.features_contrato import features_binarios_contratos
 from pemex_contratos.inai.features_procedimiento import features_binarios_procedimientos
 from pemex_contratos.inai.features_proveedor import features_binarios_proveedores
+from pemex_contratos.inai.score import PESOS_FEATURES
+from pemex_contratos.inai.score import features_binarios_nivel_contrato
+from pemex_contratos.inai.score import score_riesgo
 from pemex_contratos.load_data_proveedores import cargar_no_localizados
 from pemex_contratos.load_data_proveedores import cargar_padron_proveedores
 from pemex_contratos.load_data_proveedores import cargar_lista_contribuyentes_69b
 from pemex_contratos.load_data_proveedores import cargar_particulares_sancionados
 from pemex_contratos.load_data_proveedores import cargar_proveedores_sancionados
-
-pesos_featues = {
-    "no_en_padron_proveedores": 1,
-    "es_empresa_fantasma": 3,
-    "empresa_no_localizada": 1,
-    "tasa_exito_alta": 1,
-    "empresa_reciente": 3,
-    "market_share_contratos_riesgoso": 1,
-    "market_share_monto_riesgoso": 1,
-    "empresa_sancionada": 3,
-    "no_encontrado_en_siscep": 2,
-    "discrepancia_inai_siscep": 1,
-    "solo_una_cotizacion": 2,
-    "falta_asistencia_junta": 1,
-    "solo_una_oferta": 2,
-    "participacion_baja": 1,
-    "periodo_corto_fecha_junta_fecha_convocatoria": 2,
-    "periodo_corto_fecha_contrato_fecha_junta": 2,
-    "tuvo_convenios_modificatorios": 1,
-    "plazo_corto_entrega": 2,
-    "misma_competencia_y_tasa_exito_alta": 3,
-}
+from pemex_contratos.proyeccion import memoria_maxima_mb
 
 
 if __name__ == "__main__":
@@ -91,7 +72,11 @@ if __name__ == "__main__":
     df_contratantes = cargar_tabla_posibles_contratantes(base_path_inai)
 
     # Generar features
-    df_contrato_binarios = features_binarios_contratos(df_inai, n_contratos)
+    # solo se calculan los features que tienen peso en el score
+    columnas = set(PESOS_FEATURES)
+    df_contrato_binarios = features_binarios_contratos(
+        df_inai, n_contratos, columnas=columnas
+    )
     df_procedimiento_binarios = features_binarios_procedimientos(
         df_inai,
         df_siscep,
@@ -110,51 +95,19 @@ if __name__ == "__main__":
         particulares_sancionados=particulares_sancionados,
         padron_proveedores=padron_proveedores,
         n_proveedores=n_proveedores,
+        columnas=columnas,
     )
     # Se unen los features a nivel razon_social, num_evento y numero_contrato
-    cols = ["num_evento", "numero_contrato", "razon_social_simple"]
-    features_binarios = df_inai.groupby(cols).monto.sum().reset_index()
-    features_binarios = pd.merge(
-        features_binarios, df_proveedor_binarios, "left", "razon_social_simple"
-    )
-    features_binarios = pd.merge(
-        features_binarios, df_procedimiento_binarios, "left", "num_evento"
-    )
-    features_binarios = pd.merge(
-        features_binarios,
+    # y se agrupan a nivel contrato
+    df_nivel_contrato = features_binarios_nivel_contrato(
+        df_inai,
+        df_proveedor_binarios,
+        df_procedimiento_binarios,
         df_contrato_binarios,
-        "left",
-        ["numero_contrato", "num_evento"],
-    )
-    assert features_binarios.shape == (2117, 23)
-    # se agrupan los features de razon social y se deja la tabla a nivel contrato
-    df_nivel_contrato = features_binarios.groupby(
-        ["num_evento", "numero_contrato"]
-    ).sum()
-    assert df_nivel_contrato.shape == (2029, 20)
-    features_cols = [
-        c
-        for c in df_nivel_contrato.columns
-        if c not in {"monto", "num_evento", "numero_contrato"}
-    ]
-    # Con la agrupación de empresas los features con valores mayores a cero se de
-    # marcan como uno
-    for c in features_cols:
-        df_nivel_contrato.loc[:, c] = np.where(df_nivel_contrato[c] > 0, 1, 0)
-
-    df_nivel_contrato = df_nivel_contrato.reset_index()
-    pesos = pd.Series(pesos_featues).reindex(features_cols).to_numpy().reshape((19, 1))
-    matriz_features = df_nivel_contrato.loc[:, features_cols].fillna(0).to_numpy()
-
-    df_nivel_contrato = df_nivel_contrato.assign(
-        sum_of_features=df_nivel_contrato[features_cols].fillna(0).sum(axis=1),
-        weighted_sum_of_features=pd.Series((matriz_features @ pesos).flatten()),
-    )
-    df_nivel_contrato = df_nivel_contrato.assign(
-        log_monto_times_weighted_sum=(
-            np.log(df_nivel_contrato.monto) * df_nivel_contrato.weighted_sum_of_features
-        )
     )
+    assert df_nivel_contrato.shape == (2029, 22)
+    df_nivel_contrato = score_riesgo(df_nivel_contrato)
     assert df_nivel_contrato.shape == (2029, 25)
     df_nivel_contrato.to_csv(path_output, index=False, quoting=1, encoding="utf-8")
+    print(f"Memoria máxima: {memoria_maxima_mb():.0f} MB")
     print("Ejecución terminada.")
@@ -0,0 +1,13 @@
+"""Script que indexa los documentos descargados con descargar_info_siscep.py
+y genera la tabla de archivos por etapa de cada procedimiento. Solo se
+vuelven a revisar las carpetas que cambiaron desde la última ejecución"""
+from pemex_contratos.indice_documentos import indexar_documentos, tabla_archivos
+
+if __name__ == "__main__":
+    base_path = "../data/raw/documentos_siscep"
+    path_indice = "../data/processed/indice_documentos_siscep.csv"
+    path_archivos = "../data/processed/archivos_siscep.csv"
+    indice = indexar_documentos(base_path, path_indice)
+    df_archivos = tabla_archivos(indice)
+    df_archivos.to_csv(path_archivos, index=False, quoting=1, encoding="utf-8")
+    print(f"{indice.shape[0]} carpetas indexadas")
@@ -0,0 +1,168 @@
+"""Análisis de acumulación (bunching) de montos justo debajo de los límites
+legales de adjudicación directa o de invitación.
+
+Cada monto se expresa como proporción del límite de su año y
+tipo_contratacion. Para todos los límites a la vez se arma un histograma
+fino de esas proporciones (un solo bincount) y se ajusta un polinomio a los
+bins fuera de la región alrededor del límite (un solo lstsq con todos los
+histogramas como lados derechos). El exceso de masa es lo que se observa
+en la banda justo debajo del límite por encima de lo que predice el
+polinomio."""
+
+import numpy as np
+import pandas as pd
+from typing import Tuple
+
+
+def montos_relativos(
+    df: pd.DataFrame,
+    limites: pd.DataFrame,
+    monto_col: str = "montos_maximos_mxn",
+    fecha_col: str = "publicado",
+) -> pd.DataFrame:
+    """Cruza cada contrato con los límites de su año y tipo_contratacion.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Contratos con tipo_contratacion, monto_col y fecha_col
+    limites: pd.DataFrame
+        Tabla con anio, tipo_contratacion y limite (en pesos). Puede haber
+        varios límites por año y tipo, por ejemplo el de adjudicación
+        directa y el de invitación
+
+    Returns
+    -------
+    Tabla con posicion (renglón de df), limite_id (renglón de limites) y
+    relativo (monto / limite)
+    """
+    contratos = pd.DataFrame(
+        {
+            "posicion": np.arange(df.shape[0]),
+            "anio": df[fecha_col].dt.year.to_numpy(),
+            "tipo_contratacion": df.tipo_contratacion.to_numpy(),
+            "monto": df[monto_col].to_numpy(dtype=float),
+        }
+    )
+    limites = limites.reset_index(drop=True).assign(
+        limite_id=np.arange(limites.shape[0])
+    )
+    data = pd.merge(contratos, limites, on=["anio", "tipo_contratacion"])
+    data = data.loc[data.monto > 0]
+    data = data.assign(relativo=data.monto / data.limite)
+    return data.loc[:, ["posicion", "limite_id", "relativo"]]
+
+
+def exceso_masa(
+    relativos: pd.DataFrame,
+    n_limites: int,
+    rango: Tuple[float, float] = (0.5, 1.5),
+    ancho_bin: float = 0.01,
+    banda: Tuple[float, float] = (0.9, 1.0),
+    excluir_arriba: float = 0.1,
+    grado: int = 5,
+) -> pd.DataFrame:
+    """Exceso de masa en la banda debajo de cada límite.
+
+    Parameters
+    ----------
+    relativos: pd.DataFrame
+        Resultado de montos_relativos
+    n_limites: int
+        Número de renglones de la tabla de límites
+    rango: tuple
+        Proporciones del límite que entran al histograma
+    banda: tuple
+        Banda sospechosa [inicio, fin) como proporción del límite
+    excluir_arriba: float
+        Tampoco se usan para el ajuste los bins en [banda[1], banda[1] +
+        excluir_arriba), donde falta la masa que se movió a la banda
+    grado: int
+        Grado del polinomio contrafactual
+
+    Returns
+    -------
+    Tabla con limite_id, n_contratos (dentro del rango), observados,
+    esperados (en la banda) y exceso_masa = observados / esperados - 1
+    """
+    n_bins = int(round((rango[1] - rango[0]) / ancho_bin))
+    centros = rango[0] + ancho_bin * (np.arange(n_bins) + 0.5)
+    relativo = relativos.relativo.to_numpy()
+    bins = np.floor((relativo - rango[0]) / ancho_bin).astype(np.int64)
+    dentro = (bins >= 0) & (bins < n_bins)
+    llave = relativos.limite_id.to_numpy()[dentro] * n_bins + bins[dentro]
+    histogramas = np.bincount(llave, minlength=n_limites * n_bins).reshape(
+        n_limites, n_bins
+    )
+    en_banda = (centros >= banda[0]) & (centros < banda[1])
+    excluido = en_banda | (
+        (centros >= banda[1]) & (centros < banda[1] + excluir_arriba)
+    )
+    # polinomio en la proporción centrada en el límite; el mismo diseño
+    # sirve para todos los histogramas
+    diseno = np.vander(centros - 1, grado + 1)
+    coeficientes, *_ = np.linalg.lstsq(
+        diseno[~excluido], histogramas[:, ~excluido].T, rcond=None
+    )
+    ajuste = np.clip(diseno @ coeficientes, 0, None).T
+    observados = histogramas[:, en_banda].sum(axis=1)
+    esperados = ajuste[:, en_banda].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        exceso = np.where(esperados > 0, observados / esperados - 1, np.nan)
+    resultado = pd.DataFrame(
+        {
+            "limite_id": np.arange(n_limites),
+            "n_contratos": histogramas.sum(axis=1),
+            "observados": observados,
+            "esperados": esperados,
+            "exceso_masa": exceso,
+        }
+    )
+    return resultado
+
+
+def acumulacion_limites(
+    df: pd.DataFrame,
+    limites: pd.DataFrame,
+    monto_col: str = "montos_maximos_mxn",
+    fecha_col: str = "publicado",
+    banda: Tuple[float, float] = (0.9, 1.0),
+    exceso_min: float = 0.5,
+    contratos_min: int = 50,
+    **kwargs,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Análisis de acumulación para todos los años y tipos de contratación.
+
+    Un contrato queda marcado con monto_en_banda_sospechosa si su monto
+    está en la banda debajo de algún límite cuyo exceso_masa es al menos
+    exceso_min, con al menos contratos_min contratos en el histograma.
+    kwargs se pasan a exceso_masa.
+
+    Returns
+    -------
+    - limites con n_contratos, observados, esperados y exceso_masa
+    - id_unico y monto_en_banda_sospechosa de cada contrato de df
+    """
+    relativos = montos_relativos(df, limites, monto_col, fecha_col)
+    resumen = exceso_masa(relativos, limites.shape[0], banda=banda, **kwargs)
+    sospechoso = (resumen.exceso_masa >= exceso_min) & (
+        resumen.n_contratos >= contratos_min
+    )
+    relativo = relativos.relativo.to_numpy()
+    en_banda = (
+        (relativo >= banda[0])
+        & (relativo < banda[1])
+        & sospechoso.to_numpy()[relativos.limite_id.to_numpy()]
+    )
+    marca = np.zeros(df.shape[0], dtype=int)
+    marca[relativos.posicion.to_numpy()[en_banda]] = 1
+    feature = (
+        df.loc[:, ["id_unico"]]
+        .assign(monto_en_banda_sospechosa=marca)
+        .groupby("id_unico", as_index=False)
+        .monto_en_banda_sospechosa.max()
+    )
+    resumen = pd.concat(
+        [limites.reset_index(drop=True), resumen.drop(columns="limite_id")], axis=1
+    )
+    return resumen, feature
@@ -0,0 +1,114 @@
+"""Conformidad con la ley de Benford de los montos por proveedor,
+signatario y empresa productiva.
+
+Los dígitos significativos se obtienen aritméticamente (log10 y floor),
+sin convertir los montos a texto, y los conteos de dígitos de todos los
+grupos salen de un solo bincount sobre la llave (grupo, dígito)."""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from typing import Dict, Optional, Sequence, Tuple
+
+# probabilidades de Benford del primer dígito (1 a 9) y del segundo (0 a 9)
+BENFORD_PRIMER_DIGITO = np.log10(1 + 1 / np.arange(1, 10))
+BENFORD_SEGUNDO_DIGITO = np.log10(
+    1 + 1 / (10 * np.arange(1, 10)[:, None] + np.arange(10))
+).sum(axis=0)
+
+
+def digitos_significativos(montos: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Primer y segundo dígito significativo de cada monto. Los montos no
+    positivos o no finitos tienen -1 en ambos"""
+    montos = np.asarray(montos, dtype=float)
+    validos = np.isfinite(montos) & (montos > 0)
+    x = np.where(validos, montos, 1)
+    # mantisa en [10, 100): sus dos dígitos enteros son los significativos
+    mantisa = x / 10 ** (np.floor(np.log10(x)) - 1)
+    # el redondeo evita errores de punto flotante como 1000 -> 99.999...
+    mantisa = np.round(mantisa, 9)
+    mantisa = np.where(mantisa >= 100, mantisa / 10, mantisa)
+    mantisa = np.where(mantisa < 10, mantisa * 10, mantisa)
+    dos_digitos = np.floor(mantisa).astype(np.int64)
+    primero = np.where(validos, dos_digitos // 10, -1)
+    segundo = np.where(validos, dos_digitos % 10, -1)
+    return primero, segundo
+
+
+def _conformidad(
+    codigos: np.ndarray,
+    digitos: np.ndarray,
+    n_grupos: int,
+    esperado: np.ndarray,
+    primer_digito: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MAD, chi cuadrada y su p-valor por grupo con un solo bincount"""
+    n_digitos = esperado.shape[0]
+    validos = (codigos >= 0) & (digitos >= 0)
+    llave = codigos[validos] * n_digitos + digitos[validos] - primer_digito
+    conteos = np.bincount(llave, minlength=n_grupos * n_digitos).reshape(
+        n_grupos, n_digitos
+    )
+    n = conteos.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        proporcion = conteos / n
+        mad = np.abs(proporcion - esperado).mean(axis=1)
+        chi2 = (((conteos - n * esperado) ** 2) / (n * esperado)).sum(axis=1)
+    p_valor = stats.chi2.sf(chi2, n_digitos - 1)
+    return mad, chi2, p_valor
+
+
+def conformidad_benford(
+    df: pd.DataFrame,
+    llave: str,
+    monto_col: str = "montos_maximos_mxn",
+    montos_min: int = 30,
+    digitos: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> pd.DataFrame:
+    """MAD y chi cuadrada del primer y segundo dígito de monto_col por cada
+    valor de llave. digitos es el resultado de digitos_significativos si ya
+    se calculó.
+
+    Returns
+    -------
+    Tabla con llave, n_montos, mad_primer_digito, chi2_primer_digito,
+    p_valor_primer_digito y las mismas del segundo dígito. Los grupos con
+    menos de montos_min montos válidos tienen nulos
+    """
+    codigos, grupos = pd.factorize(df[llave], sort=True)
+    if digitos is None:
+        digitos = digitos_significativos(df[monto_col].to_numpy(dtype=float))
+    primero, segundo = digitos
+    n_grupos = grupos.shape[0]
+    n_montos = np.bincount(codigos[(codigos >= 0) & (primero > 0)], minlength=n_grupos)
+    feature = pd.DataFrame({llave: grupos, "n_montos": n_montos})
+    poco = n_montos < montos_min
+    for nombre, valores, esperado, inicio in [
+        ("primer_digito", primero, BENFORD_PRIMER_DIGITO, 1),
+        ("segundo_digito", segundo, BENFORD_SEGUNDO_DIGITO, 0),
+    ]:
+        mad, chi2, p_valor = _conformidad(codigos, valores, n_grupos, esperado, inicio)
+        feature[f"mad_{nombre}"] = np.where(poco, np.nan, mad)
+        feature[f"chi2_{nombre}"] = np.where(poco, np.nan, chi2)
+        feature[f"p_valor_{nombre}"] = np.where(poco, np.nan, p_valor)
+    return feature
+
+
+def features_benford(
+    df: pd.DataFrame,
+    llaves: Sequence[str] = (
+        "empresa_ganadora",
+        "signatario_pemex",
+        "empresa_productiva",
+    ),
+    monto_col: str = "montos_maximos_mxn",
+    montos_min: int = 30,
+) -> Dict[str, pd.DataFrame]:
+    """conformidad_benford para cada llave. Los dígitos se calculan una
+    vez. Para el inai usar llaves razon_social_simple y empresa_productiva
+    con monto_col monto"""
+    digitos = digitos_significativos(df[monto_col].to_numpy(dtype=float))
+    return {
+        llave: conformidad_benford(df, llave, monto_col, montos_min, digitos)
+        for llave in llaves
+    }
@@ -0,0 +1,287 @@
+"""Funciones para detectar patrones de colusión en las invitaciones del
+siscep a partir de la tabla larga de participantes (ver
+preprocess.process_invitaciones). cobertura_por_empresa trabaja sobre
+códigos enteros de evento y empresa, por lo que también se usa con la
+tabla de ofertas del inai"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def _hash_empresas(participante: pd.Series, semilla: int = 0) -> np.ndarray:
+    """Asigna a cada empresa un entero aleatorio uint64. La suma de los de
+    un conjunto identifica al conjunto sin importar el orden"""
+    codigos, empresas = pd.factorize(participante)
+    rng = np.random.default_rng(semilla)
+    valores = rng.integers(
+        0, np.iinfo(np.uint64).max, empresas.shape[0], dtype=np.uint64
+    )
+    return valores[codigos]
+
+
+def _fronteras(llaves: np.ndarray):
+    """Para un arreglo ordenado regresa el código de grupo de cada elemento
+    y la posición donde empieza cada grupo"""
+    nuevo = np.ones(llaves.shape[0], dtype=bool)
+    nuevo[1:] = llaves[1:] != llaves[:-1]
+    return np.cumsum(nuevo) - 1, np.flatnonzero(nuevo)
+
+
+def conjuntos_participantes(participantes: pd.DataFrame) -> pd.DataFrame:
+    """Identifica el conjunto de empresas de cada evento.
+
+    Parameters
+    ----------
+    participantes: pd.DataFrame
+        Tabla con num_evento, participante y estatus (ganador o perdedor)
+
+    Returns
+    -------
+    Tabla con num_evento, conjunto (hash del conjunto de participantes),
+    n_participantes y ganador
+    """
+    data = participantes.loc[
+        ~participantes.participante.isna(), ["num_evento", "participante", "estatus"]
+    ].drop_duplicates(["num_evento", "participante"])
+    data = data.sort_values("num_evento", kind="mergesort")
+    valores = _hash_empresas(data.participante)
+    eventos = data.num_evento.to_numpy()
+    codigo_evento, inicio = _fronteras(eventos)
+    # la suma de uint64 da la vuelta (módulo 2**64), lo que no afecta al hash
+    conjunto = np.zeros(inicio.shape[0], dtype=np.uint64)
+    np.add.at(conjunto, codigo_evento, valores)
+    ganadores = data.loc[data.estatus == "ganador"].drop_duplicates("num_evento")
+    conjuntos = pd.DataFrame(
+        {
+            "num_evento": eventos[inicio],
+            "conjunto": conjunto,
+            "n_participantes": np.bincount(codigo_evento, minlength=inicio.shape[0]),
+        }
+    )
+    conjuntos = pd.merge(
+        conjuntos,
+        ganadores.loc[:, ["num_evento", "participante"]].rename(
+            columns={"participante": "ganador"}
+        ),
+        "left",
+        on="num_evento",
+    )
+    return conjuntos
+
+
+def rotacion_ofertas(
+    participantes: pd.DataFrame,
+    invitaciones: pd.DataFrame,
+    eventos_min: int = 3,
+    entropia_min: float = 0.9,
+    variacion_max: float = 0.25,
+) -> pd.DataFrame:
+    """Estadísticas de rotación de ganadores para cada conjunto de empresas
+    que se repite en varias invitaciones.
+
+    Los eventos se ordenan una vez por (conjunto, publicado) y todas las
+    estadísticas se calculan sobre ese arreglo ordenado con las fronteras
+    de cada conjunto, sin iterar por evento:
+
+    - entropia_ganadores: entropía de la distribución de ganadores,
+      normalizada por log(n_participantes)
+    - tasa_alternancia: proporción de eventos consecutivos en los que
+      cambia el ganador
+    - variacion_turnos: coeficiente de variación del número de eventos
+      entre dos triunfos de la misma empresa. Es cero si los turnos son
+      perfectamente regulares
+
+    Un conjunto se marca con rotacion_sospechosa si tiene al menos
+    eventos_min eventos, más de un ganador, entropia_ganadores >=
+    entropia_min y variacion_turnos <= variacion_max.
+
+    Parameters
+    ----------
+    participantes: pd.DataFrame
+        Resultado de process_invitaciones
+    invitaciones: pd.DataFrame
+        Tabla con num_evento y publicado
+    """
+    conjuntos = conjuntos_participantes(participantes)
+    publicado = invitaciones.groupby("num_evento").publicado.min()
+    conjuntos = conjuntos.assign(publicado=conjuntos.num_evento.map(publicado))
+    conjuntos = conjuntos.loc[~conjuntos.ganador.isna()]
+    conjuntos = conjuntos.sort_values(["conjunto", "publicado"], kind="mergesort")
+    conjunto = conjuntos.conjunto.to_numpy()
+    n = conjunto.shape[0]
+    codigo_grupo, inicio = _fronteras(conjunto)
+    n_grupos = inicio.shape[0]
+    n_eventos = np.bincount(codigo_grupo, minlength=n_grupos)
+    ganador, ganadores = pd.factorize(conjuntos.ganador)
+    # entropía de los ganadores de cada conjunto
+    pares, conteos = np.unique(
+        codigo_grupo * ganadores.shape[0] + ganador, return_counts=True
+    )
+    grupo_par = pares // max(ganadores.shape[0], 1)
+    p = conteos / n_eventos[grupo_par]
+    entropia = np.bincount(grupo_par, weights=-p * np.log(p), minlength=n_grupos)
+    n_ganadores = np.bincount(grupo_par, minlength=n_grupos)
+    n_participantes = conjuntos.n_participantes.to_numpy()[inicio]
+    entropia_normalizada = np.where(
+        n_participantes > 1,
+        entropia / np.log(np.maximum(n_participantes, 2)),
+        0,
+    )
+    # alternancia: cambios de ganador entre eventos consecutivos del conjunto
+    mismo_grupo = np.r_[False, codigo_grupo[1:] == codigo_grupo[:-1]]
+    cambio = mismo_grupo & np.r_[False, ganador[1:] != ganador[:-1]]
+    cambios = np.bincount(codigo_grupo, weights=cambio, minlength=n_grupos)
+    tasa_alternancia = cambios / np.maximum(n_eventos - 1, 1)
+    # turnos: eventos transcurridos desde el triunfo anterior de la misma
+    # empresa en el conjunto (shift dentro de cada (conjunto, ganador))
+    posicion = np.arange(n) - np.repeat(inicio, n_eventos)
+    turnos = pd.Series(posicion).groupby([codigo_grupo, ganador]).diff().to_numpy()
+    con_turno = ~np.isnan(turnos)
+    suma = np.bincount(codigo_grupo[con_turno], turnos[con_turno], n_grupos)
+    suma_cuadrados = np.bincount(
+        codigo_grupo[con_turno], turnos[con_turno] ** 2, n_grupos
+    )
+    n_turnos = np.bincount(codigo_grupo[con_turno], minlength=n_grupos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = suma / n_turnos
+        varianza = np.maximum(suma_cuadrados / n_turnos - media**2, 0)
+        variacion_turnos = np.sqrt(varianza) / media
+    resultado = pd.DataFrame(
+        {
+            "conjunto": conjunto[inicio],
+            "n_participantes": n_participantes,
+            "n_eventos": n_eventos,
+            "n_ganadores": n_ganadores,
+            "entropia_ganadores": entropia_normalizada,
+            "tasa_alternancia": tasa_alternancia,
+            "variacion_turnos": variacion_turnos,
+            "primer_evento": conjuntos.publicado.to_numpy()[inicio],
+            "ultimo_evento": conjuntos.publicado.to_numpy()[inicio + n_eventos - 1],
+        }
+    )
+    sospechosa = (
+        (resultado.n_eventos >= eventos_min)
+        & (resultado.n_ganadores > 1)
+        & (resultado.entropia_ganadores >= entropia_min)
+        & (resultado.variacion_turnos <= variacion_max)
+    )
+    resultado = resultado.assign(rotacion_sospechosa=sospechosa.astype(int))
+    return resultado
+
+
+def empresas_en_rotacion(
+    participantes: pd.DataFrame, rotacion: pd.DataFrame
+) -> pd.DataFrame:
+    """Marca con 1 a las empresas que participan en algún conjunto con
+    rotacion_sospechosa"""
+    conjuntos = conjuntos_participantes(participantes)
+    sospechosos = rotacion.loc[rotacion.rotacion_sospechosa == 1, "conjunto"]
+    eventos = conjuntos.loc[conjuntos.conjunto.isin(sospechosos), "num_evento"]
+    data = participantes.loc[~participantes.participante.isna()]
+    feature = (
+        data.assign(en_rotacion=data.num_evento.isin(eventos).astype(int))
+        .groupby("participante", as_index=False)
+        .en_rotacion.max()
+    )
+    return feature
+
+
+def cobertura_por_empresa(
+    evento: np.ndarray,
+    empresa: np.ndarray,
+    es_ganador: np.ndarray,
+    empresas: np.ndarray,
+    participaciones_min: int = 5,
+    hhi_min: float = 0.5,
+) -> pd.DataFrame:
+    """Patrón de ofertas de cobertura: empresas que participan seguido,
+    nunca ganan y siempre pierden contra los mismos ganadores.
+
+    Las participaciones (evento, empresa) se cuentan en dos matrices
+    dispersas evento x empresa, una de ganadores y otra de perdedores. El
+    producto perdedores^T ganadores cuenta cuántas veces cada empresa
+    perdió contra cada ganadora, y de sus renglones sale el índice de
+    Herfindahl de los ganadores contra los que perdió.
+
+    Parameters
+    ----------
+    evento, empresa: np.ndarray
+        Códigos enteros de cada participación. empresa indexa a empresas
+    es_ganador: np.ndarray
+        La empresa ganó el evento
+    empresas: np.ndarray
+        Nombre de cada código de empresa
+
+    Returns
+    -------
+    Tabla con empresa, participaciones, ganados, hhi_ganadores (nulo si
+    nunca perdió), ganador_principal (contra quien más perdió),
+    perdedor_perpetuo (al menos participaciones_min participaciones, cero
+    ganados y hhi_ganadores >= hhi_min) y beneficiario_ofertas_cobertura
+    (es ganador_principal de algún perdedor_perpetuo)
+    """
+    n_empresas = empresas.shape[0]
+    # una participación por (evento, empresa); gana si alguna vez ganó
+    llaves = evento.astype(np.int64) * n_empresas + empresa
+    orden = np.lexsort((~np.asarray(es_ganador, dtype=bool), llaves))
+    llaves, primera = np.unique(llaves[orden], return_index=True)
+    gano = np.asarray(es_ganador, dtype=bool)[orden][primera]
+    evento, empresa = llaves // n_empresas, llaves % n_empresas
+    n_eventos = int(evento.max()) + 1 if evento.shape[0] else 0
+
+    def incidencia(filtro):
+        return sparse.csr_matrix(
+            (np.ones(filtro.sum()), (evento[filtro], empresa[filtro])),
+            shape=(n_eventos, n_empresas),
+        )
+
+    perdidas = (incidencia(~gano).T @ incidencia(gano)).tocsr()
+    total = np.asarray(perdidas.sum(axis=1)).ravel()
+    cuadrados = np.asarray(perdidas.multiply(perdidas).sum(axis=1)).ravel()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hhi = cuadrados / total**2
+    principal = np.zeros(n_empresas, dtype=np.int64)
+    if n_empresas:
+        principal = np.asarray(perdidas.argmax(axis=1)).ravel()
+    participaciones = np.bincount(empresa, minlength=n_empresas)
+    ganados = np.bincount(empresa[gano], minlength=n_empresas)
+    perpetuo = (
+        (participaciones >= participaciones_min)
+        & (ganados == 0)
+        & (total > 0)
+        & (np.nan_to_num(hhi) >= hhi_min)
+    )
+    beneficiario = np.zeros(n_empresas, dtype=int)
+    beneficiario[principal[perpetuo]] = 1
+    feature = pd.DataFrame(
+        {
+            "empresa": empresas,
+            "participaciones": participaciones,
+            "ganados": ganados,
+            "hhi_ganadores": hhi,
+            "ganador_principal": np.where(total > 0, empresas[principal], None),
+            "perdedor_perpetuo": perpetuo.astype(int),
+            "beneficiario_ofertas_cobertura": beneficiario,
+        }
+    )
+    return feature
+
+
+def ofertas_cobertura(
+    participantes: pd.DataFrame, participaciones_min: int = 5, hhi_min: float = 0.5
+) -> pd.DataFrame:
+    """cobertura_por_empresa para el resultado de process_invitaciones. La
+    columna empresa se llama participante"""
+    data = participantes.loc[~participantes.participante.isna()]
+    evento = pd.factorize(data.num_evento)[0]
+    empresa, empresas = pd.factorize(data.participante, sort=True)
+    feature = cobertura_por_empresa(
+        evento,
+        empresa,
+        (data.estatus == "ganador").to_numpy(),
+        np.asarray(empresas, dtype=object),
+        participaciones_min,
+        hhi_min,
+    )
+    return feature.rename(columns={"empresa": "participante"})
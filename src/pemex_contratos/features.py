@@ -1,5 +1,6 @@
 import pandas as pd
-import sidetable as stb
+from typing import List
+from .linea_tiempo import ETAPAS_SISCEP, duraciones, linea_tiempo
 
 
 # TODO: add pandera. El shape de ids es 1351
@@ -75,35 +76,13 @@ def dias_entre_etapas(df: pd.DataFrame) -> pd.DataFrame:
     df_ids = data.loc[:, ["id_unico"]].drop_duplicates()
     # no se calcula para adjudicaciones
     data = data.loc[data.tipo_contratacion.isin({"invitacion", "concurso_abierto"})]
-    cols = ["id_unico", "tipo_contratacion", "fecha_recepcion_propuestas"]
-    cols_publicado = cols + ["publicado"]
-    cols_fallo = cols + ["fecha_fallo"]
-    data_publicado = data.groupby(
-        cols_publicado, as_index=False
-    ).montos_maximos_mxn.sum()
-    data_fallo = data.groupby(cols_fallo, as_index=False).montos_maximos_mxn.sum()
-    diff = (
-        data_publicado.fecha_recepcion_propuestas - data_publicado.publicado
-    ).dt.days
-    data_publicado = data_publicado.assign(dias_convocatoria_y_propuestas=diff).drop(
-        "fecha_recepcion_propuestas", axis=1
-    )
-    diff = (data_fallo.fecha_fallo - data_fallo.fecha_recepcion_propuestas).dt.days
-    data_fallo = data_fallo.assign(dias_propuestas_y_resultado=diff).drop(
-        ["montos_maximos_mxn"], axis=1
-    )
-    data = pd.merge(
-        data_publicado, data_fallo, how="outer", on=["id_unico", "tipo_contratacion"]
-    )
-    data = pd.merge(df_ids, data, on="id_unico", how="left")
-    cols_drop = [
-        "tipo_contratacion",
-        "publicado",
-        "montos_maximos_mxn",
-        "fecha_recepcion_propuestas",
-        "fecha_fallo",
-    ]
-    data = data.drop(cols_drop, axis=1)
+    dias = duraciones(linea_tiempo(data, ETAPAS_SISCEP, llaves=["id_unico"]))
+    names = {
+        "dias_publicado_a_recepcion_propuestas": "dias_convocatoria_y_propuestas",
+        "dias_recepcion_propuestas_a_fallo": "dias_propuestas_y_resultado",
+    }
+    dias = dias.loc[:, names.keys()].rename(columns=names).reset_index()
+    data = pd.merge(df_ids, dias, on="id_unico", how="left")
     return data
 
 
@@ -162,37 +141,59 @@ def empresas_con_adjudicaciones(df: pd.DataFrame) -> pd.DataFrame:
     return data
 
 
+def market_share(
+    df: pd.DataFrame,
+    dimensiones: List[str],
+    valor: str = "montos_maximos_mxn",
+    entidad: str = "empresa_ganadora",
+    agregacion: str = "sum",
+    ancho: bool = True,
+) -> pd.DataFrame:
+    """Calcula el porcentaje (0 a 100) que representa cada entidad del total
+    de valor dentro de cada combinación de dimensiones.
+
+    Se agrupa una sola vez por dimensiones + entidad y los totales salen de
+    un transform('sum'), sin ciclos por categoría. La dimensión "year" se
+    obtiene de la columna publicado si no existe en df.
+
+    Returns
+    -------
+    Si ancho es True, una tabla con una fila por entidad y una columna por
+    combinación de dimensiones (con ceros donde no hay participación). Si
+    es False, la tabla larga con dimensiones, entidad, valor y pc_{valor}
+    """
+    if "year" in dimensiones and "year" not in df.columns:
+        df = df.assign(year=df.publicado.dt.year)
+    data = df.groupby(dimensiones + [entidad])[valor].agg(agregacion).reset_index()
+    totales = data.groupby(dimensiones)[valor].transform("sum")
+    data = data.assign(**{f"pc_{valor}": data[valor].divide(totales) * 100})
+    if not ancho:
+        return data
+    columns = dimensiones[0] if len(dimensiones) == 1 else dimensiones
+    data = data.pivot_table(
+        index=entidad, columns=columns, values=f"pc_{valor}", fill_value=0
+    )
+    return data
+
+
 def market_share_tipo_iniciativa(df: pd.DataFrame) -> pd.DataFrame:
     """Calcula el market share para cada empresa en los diferentes tipos
     de suministros como Servicios, Obra pública y Bienes"""
     data = df.loc[df.Resultado == "ADJUDICADA"]
     df_proveedores = data.loc[:, ["empresa_ganadora"]].drop_duplicates()
     data = data.loc[data.montos_maximos_mxn > 0]
-    data = (
-        data.groupby(["empresa_ganadora", "tipo_iniciativa"])
-        .agg({"id_unico": "nunique", "montos_maximos_mxn": "sum"})
-        .rename(columns={"id_unico": "contrataciones", "montos_maximos_mxn": "monto"})
-        .reset_index()
+    tipos = ["Bienes", "Servicios", "Obra pública"]
+    data = data.loc[data.tipo_iniciativa.isin(tipos)].rename(
+        columns={"montos_maximos_mxn": "monto"}
     )
-    data = data.loc[data.tipo_iniciativa.isin({"Bienes", "Servicios", "Obra pública"})]
-    # return data
     # calcular los porcentajes
     column = "monto"
-    dfs = []
-    for t in ["Bienes", "Servicios", "Obra pública"]:
-        col_title = "_".join(t.split(" ")).lower()
-        df_pcs = (
-            data.loc[data.tipo_iniciativa == t]
-            .stb.freq(["empresa_ganadora"], value=column)
-            .drop([f"Cumulative {column}", "Cumulative Percent", column], axis=1)
-            .set_index("empresa_ganadora")
-        )
-        df_pcs = df_pcs.assign(Percent=df_pcs.Percent * 100).rename(
-            columns={"Percent": f"pc_{column}_{col_title}"}
-        )
-        dfs.append(df_pcs)
-    df_market = pd.concat(dfs, axis=1).fillna(0)
-    df_market = df_market.reset_index().rename(columns={"index": "empresa_ganadora"})
+    df_market = market_share(data, ["tipo_iniciativa"], valor=column)
+    df_market = df_market.reindex(columns=tipos, fill_value=0).rename(
+        columns={t: f"pc_{column}_{'_'.join(t.split(' ')).lower()}" for t in tipos}
+    )
+    df_market.columns.name = None
+    df_market = df_market.reset_index()
     df_proveedores = pd.merge(
         df_proveedores, df_market, on="empresa_ganadora", how="left"
     )
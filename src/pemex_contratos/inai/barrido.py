@@ -0,0 +1,231 @@
+"""Funciones para recalibrar los umbrales de los features binarios.
+
+Cada valor continuo se calcula una sola vez y se ordena una sola vez; la
+marca para todos los umbrales de la malla sale de comparar el rango de cada
+valor contra la posición de cada umbral (searchsorted). El resultado es un
+cubo de marcas (renglones x umbrales) por feature."""
+import itertools
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Sequence, Tuple
+from .features_contrato import PERIODOS_CONTRATO, duraciones_por_contrato
+from .features_proveedor import (coparticipacion_ganadores,
+                                 empresa_creada_recientemente,
+                                 shares_por_grupo,
+                                 tasa_exito_proveedor)
+
+OPERADORES = {'<', '<=', '>', '>='}
+
+
+def barrido_umbrales(valores: pd.Series,
+                     umbrales: Sequence,
+                     operador: str) -> pd.DataFrame:
+    """Marca cada valor contra todos los umbrales con una sola ordenación.
+
+    Parameters
+    ----------
+    valores: pd.Series
+        Valores continuos del feature. Los nulos nunca se marcan
+    umbrales: list
+        Malla de umbrales
+    operador: str
+        Comparación valor-umbral que genera la marca: '<', '<=', '>' o '>='
+
+    Returns
+    -------
+    Tabla int8 con el índice de valores y una columna por umbral
+    """
+    if operador not in OPERADORES:
+        raise ValueError(f'{operador} is not in {OPERADORES}')
+    x = valores.to_numpy()
+    umbrales_arr = np.asarray(umbrales)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64).astype(float)
+        x[valores.isna().to_numpy()] = np.nan
+        umbrales_arr = (pd.to_datetime(umbrales_arr).to_numpy()
+                        .astype('datetime64[ns]').astype(np.int64))
+    x = x.astype(float)
+    con_valor = ~np.isnan(x)
+    orden = np.argsort(x[con_valor], kind='mergesort')
+    ordenados = x[con_valor][orden]
+    # rango de cada valor en el arreglo ordenado; los empates quedan juntos
+    rango = np.empty(orden.shape[0], dtype=np.int64)
+    rango[orden] = np.arange(orden.shape[0])
+    lado = 'left' if operador in {'<', '>='} else 'right'
+    posiciones = np.searchsorted(ordenados, umbrales_arr, side=lado)
+    marcas = np.zeros((x.shape[0], umbrales_arr.shape[0]), dtype=np.int8)
+    if operador in {'<', '<='}:
+        marcas[con_valor] = rango[:, None] < posiciones[None, :]
+    else:
+        marcas[con_valor] = rango[:, None] >= posiciones[None, :]
+    return pd.DataFrame(marcas, index=valores.index, columns=list(umbrales))
+
+
+def barrido_cuantiles(df: pd.DataFrame,
+                      llaves: List[str],
+                      columna: str,
+                      cuantiles: Sequence[float],
+                      operador: str) -> pd.DataFrame:
+    """Igual que barrido_umbrales pero el umbral es el cuantil de cada grupo
+    de llaves. Todos los cuantiles de todos los grupos salen de un solo
+    groupby.quantile"""
+    if operador not in OPERADORES:
+        raise ValueError(f'{operador} is not in {OPERADORES}')
+    umbrales = (df.groupby(llaves)[columna].quantile(list(cuantiles))
+                .unstack(-1)
+                .reindex(columns=list(cuantiles)))
+    grupo = pd.MultiIndex.from_frame(df.loc[:, llaves]) if len(llaves) > 1 \
+        else pd.Index(df[llaves[0]])
+    umbrales = umbrales.reindex(grupo).to_numpy()
+    x = df[columna].to_numpy(dtype=float)[:, None]
+    with np.errstate(invalid='ignore'):
+        if operador == '<':
+            marcas = x < umbrales
+        elif operador == '<=':
+            marcas = x <= umbrales
+        elif operador == '>':
+            marcas = x > umbrales
+        else:
+            marcas = x >= umbrales
+    return pd.DataFrame(marcas.astype(np.int8), index=df.index,
+                        columns=list(cuantiles))
+
+
+def barrido_conjunto(df: pd.DataFrame,
+                     condiciones: Dict[str, Tuple[Sequence, str]]) -> pd.DataFrame:
+    """Barrido de un feature que combina varias condiciones con 'y'. Cada
+    columna se barre por separado y la marca de cada combinación de la malla
+    es el producto de sus marcas.
+
+    Parameters
+    ----------
+    condiciones: dict
+        columna -> (malla de umbrales, operador)
+
+    Returns
+    -------
+    Tabla con una columna por combinación de umbrales (MultiIndex)
+    """
+    barridos = [barrido_umbrales(df[c], u, op).to_numpy()
+                for c, (u, op) in condiciones.items()]
+    mallas = [list(u) for u, _ in condiciones.values()]
+    combinaciones = list(itertools.product(*[range(len(m)) for m in mallas]))
+    marcas = np.ones((df.shape[0], len(combinaciones)), dtype=np.int8)
+    for j, barrido in enumerate(barridos):
+        indices = [combinacion[j] for combinacion in combinaciones]
+        marcas &= barrido[:, indices]
+    columnas = pd.MultiIndex.from_tuples(
+        [tuple(m[i] for m, i in zip(mallas, combinacion))
+         for combinacion in combinaciones],
+        names=list(condiciones),
+    )
+    return pd.DataFrame(marcas, index=df.index, columns=columnas)
+
+
+def resumen_barrido(cubo: pd.DataFrame, referencia) -> pd.DataFrame:
+    """Cuántos renglones se marcan con cada umbral y cuántos cambian de
+    marca respecto a la columna de referencia (el umbral actual)"""
+    base = cubo[referencia].to_numpy()[:, None]
+    marcas = cubo.to_numpy()
+    resumen = pd.DataFrame({
+        'marcados': marcas.sum(axis=0),
+        'pasan_a_1': ((marcas == 1) & (base == 0)).sum(axis=0),
+        'pasan_a_0': ((marcas == 0) & (base == 1)).sum(axis=0),
+    }, index=cubo.columns)
+    resumen = resumen.assign(cambian=resumen.pasan_a_1 + resumen.pasan_a_0)
+    return resumen
+
+
+def a_nivel_contrato(cubo: pd.DataFrame,
+                     procedimientos: pd.DataFrame) -> pd.DataFrame:
+    """Lleva un cubo por razon_social_simple a nivel (num_evento,
+    numero_contrato): un contrato se marca si alguna de sus empresas se
+    marca, igual que en calcular_score_riesgo"""
+    cols = ['num_evento', 'numero_contrato', 'razon_social_simple']
+    contratos = procedimientos.loc[:, cols].dropna().drop_duplicates()
+    marcas = cubo.reindex(contratos.razon_social_simple).fillna(0).to_numpy()
+    marcas = pd.DataFrame(marcas.astype(np.int8), columns=cubo.columns)
+    marcas.index = pd.MultiIndex.from_frame(contratos.loc[:, cols[:2]])
+    return marcas.groupby(level=[0, 1]).max()
+
+
+def barrido_periodos_contratos(procedimientos: pd.DataFrame,
+                               cuantiles: Sequence[float]) -> Dict[str, pd.DataFrame]:
+    """Cubo de los features de periodos cortos (3, 4 y 24) para una malla
+    de cuantil_max"""
+    df = duraciones_por_contrato(procedimientos)
+    cubos = {}
+    for col, (_, col_binario) in PERIODOS_CONTRATO.items():
+        cubo = barrido_cuantiles(df, ['materia'], col, cuantiles, '<')
+        cubo.index = pd.MultiIndex.from_frame(df.loc[:, ['num_evento', 'numero_contrato']])
+        cubos[col_binario] = cubo
+    return cubos
+
+
+def barrido_empresa_reciente(procedimientos: pd.DataFrame,
+                             fechas_max: Sequence[str]) -> pd.DataFrame:
+    """Cubo de empresa_reciente para una malla de fecha_max"""
+    data = empresa_creada_recientemente(procedimientos)
+    data = data.set_index('razon_social_simple')
+    return barrido_umbrales(data.fecha_creacion_rfc, fechas_max, '>=')
+
+
+def barrido_tasa_exito(procedimientos: pd.DataFrame,
+                       ofertas: pd.DataFrame,
+                       umbrales: Sequence[float]) -> pd.DataFrame:
+    """Cubo de tasa_exito_alta para una malla de threshold"""
+    data = tasa_exito_proveedor(procedimientos, ofertas, 0.5)
+    data = data.set_index('razon_social_simple')
+    return barrido_umbrales(data.tasa_exito, umbrales, '>')
+
+
+def barrido_market_share(procedimientos: pd.DataFrame,
+                         cuantiles: Sequence[float]) -> Dict[str, pd.DataFrame]:
+    """Cubos de market_share_monto_riesgoso y market_share_contratos_riesgoso
+    para una malla de cuantil_min. Una empresa se marca si supera el cuantil
+    en alguno de sus grupos"""
+    data = shares_por_grupo(procedimientos)
+    cubos = {}
+    for col, feature in [('share_monto', 'market_share_monto_riesgoso'),
+                         ('share_contratos', 'market_share_contratos_riesgoso')]:
+        cubo = barrido_cuantiles(
+            data, ['empresa_productiva', 'materia'], col, cuantiles, '>'
+        )
+        cubo.index = pd.Index(data.razon_social_simple)
+        cubos[feature] = cubo.groupby(level=0).max()
+    return cubos
+
+
+def estadisticas_participacion_conjunta(procedimientos: pd.DataFrame,
+                                        participantes: pd.DataFrame) -> pd.DataFrame:
+    """Valores continuos de participacion_conjunta_sospechosa por empresa
+    ganadora: participaciones, la mayor proporción de participación conjunta
+    con otra empresa y la tasa de éxito"""
+    data = coparticipacion_ganadores(procedimientos, participantes)
+    data = data.set_index('razon_social_simple')
+    data = data.assign(
+        ratio_part_conjunta=data.max_participacion_conjunta / data.participaciones,
+        tasa_exito=data.contratos_ganados / data.participaciones,
+    )
+    return data.loc[:, ['participaciones', 'ratio_part_conjunta', 'tasa_exito']]
+
+
+def barrido_participacion_conjunta(procedimientos: pd.DataFrame,
+                                   participantes: pd.DataFrame,
+                                   participaciones_min: Sequence[int],
+                                   ratio_part_conjunta_min: Sequence[float],
+                                   tasa_exito_min: Sequence[float]) -> pd.DataFrame:
+    """Cubo de misma_competencia_y_tasa_exito_alta para todas las
+    combinaciones de los tres umbrales"""
+    data = estadisticas_participacion_conjunta(procedimientos, participantes)
+    condiciones = {
+        'participaciones_min': (participaciones_min, '>='),
+        'ratio_part_conjunta_min': (ratio_part_conjunta_min, '>='),
+        'tasa_exito_min': (tasa_exito_min, '>='),
+    }
+    data = data.rename(columns={
+        'participaciones': 'participaciones_min',
+        'ratio_part_conjunta': 'ratio_part_conjunta_min',
+        'tasa_exito': 'tasa_exito_min',
+    })
+    return barrido_conjunto(data, condiciones)
@@ -1,66 +1,169 @@
 """Funciones para calcular los features a nivel contrato"""
 import pandas as pd
+from typing import List, Optional, Set
+from ..linea_tiempo import ETAPAS_INAI, duraciones, linea_tiempo
+from .fraccionamiento import fraccionamiento
+from .umbrales import actualizar_sketch, intervalos_bootstrap, marcar_con_umbrales
+
+# duración -> (columna de duraciones_contratos, feature binario)
+PERIODOS_CONTRATO = {
+    'diferencia_fecha_junta_fecha_convocatoria': (
+        'dias_convocatoria_a_junta_aclaraciones',
+        'periodo_corto_fecha_junta_fecha_convocatoria',
+    ),
+    'diferencia_fecha_contrato_fecha_junta': (
+        'dias_junta_aclaraciones_a_contrato',
+        'periodo_corto_fecha_contrato_fecha_junta',
+    ),
+    'diferenica_plazo_entrega': (
+        'dias_inicio_plazo_a_termino_plazo',
+        'plazo_corto_entrega',
+    ),
+}
+
+# en el orden de columnas de la tabla final
+FEATURES_BINARIOS_CONTRATO: List[str] = [
+    'periodo_corto_fecha_junta_fecha_convocatoria',
+    'periodo_corto_fecha_contrato_fecha_junta',
+    'tuvo_convenios_modificatorios',
+    'plazo_corto_entrega',
+]
 
 
 def features_binarios_contratos(
         procedimientos: pd.DataFrame,
-        n_contratos: int = 2029) -> pd.DataFrame:
+        n_contratos: int = 2029,
+        columnas: Optional[Set[str]] = None) -> pd.DataFrame:
     # esta funcion sólo regresa los features binarios de la tabla final
-    dfs = [
-        diferencia_fecha_junta_fecha_convocatoria(procedimientos),
-        diferencia_fecha_contrato_fecha_junta(procedimientos),
-        con_convenios_modificatorios(procedimientos),
-        diferencia_fecha_termino_e_inicio_plazo(procedimientos),
-    ]
+    # columnas indica los features que se necesitan, también se pueden
+    # pedir las duraciones de PERIODOS_CONTRATO. Los nombres que no son de
+    # este nivel se ignoran
+    if columnas is None:
+        columnas = set(FEATURES_BINARIOS_CONTRATO)
+    periodos = [col for col, (_, col_binario) in PERIODOS_CONTRATO.items()
+                if col in columnas or col_binario in columnas]
+    dfs = []
+    if len(periodos):
+        dfs.append(periodos_cortos_contratos(procedimientos, periodos=periodos))
+    if 'tuvo_convenios_modificatorios' in columnas:
+        dfs.append(con_convenios_modificatorios(procedimientos))
+    if 'posible_fraccionamiento' in columnas:
+        dfs.append(posible_fraccionamiento(procedimientos))
+    if not len(dfs):
+        return procedimientos.loc[:, ['num_evento', 'numero_contrato']].drop_duplicates()
     dfs = [df.set_index(['num_evento', 'numero_contrato']) for df in dfs]
     if not all(df.shape[0] == n_contratos for df in dfs):
         m = ('Existen shapes que no son iguales al número de contratos indicado. '
              f'Los shapes son los siguientes: {[df.shape[0] for df in dfs]}')
         raise ValueError(m)
     df_features_contratos = pd.concat(dfs, axis=1, ignore_index=False).reset_index()
-    # se quitan los features que no son binarios
-    cols = [
-        'diferenica_plazo_entrega',
-        'diferencia_fecha_contrato_fecha_junta',
-        'diferencia_fecha_junta_fecha_convocatoria',
+    # se quitan los features que no se pidieron; los binarios van en el
+    # orden de FEATURES_BINARIOS_CONTRATO y después los demás
+    cols = ['num_evento', 'numero_contrato'] + [
+        c for c in FEATURES_BINARIOS_CONTRATO if c in columnas
+    ] + [
+        c for c in df_features_contratos.columns
+        if c in columnas and c not in FEATURES_BINARIOS_CONTRATO
     ]
-    df_features_contratos = df_features_contratos.drop(cols, axis=1)
+    df_features_contratos = df_features_contratos.loc[:, cols]
     return df_features_contratos
 
 
+def duraciones_contratos(procedimientos: pd.DataFrame) -> pd.DataFrame:
+    """Días entre todas las etapas de cada renglón de procedimientos
+    (ver linea_tiempo.ETAPAS_INAI)"""
+    return duraciones(linea_tiempo(procedimientos, ETAPAS_INAI))
+
+
+def duraciones_por_contrato(
+        procedimientos: pd.DataFrame,
+        dias: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """Duraciones de PERIODOS_CONTRATO por contrato. Los consorcios se
+    agrupan una vez por (num_evento, ID) y se toma la duración mínima"""
+    if dias is None:
+        dias = duraciones_contratos(procedimientos)
+    cols = ['ID', 'num_evento', 'materia', 'numero_contrato']
+    df = procedimientos.loc[:, cols].assign(**{
+        col: dias[col_dias] for col, (col_dias, _) in PERIODOS_CONTRATO.items()
+    })
+    # se agrupan los consorcios
+    agg = {col: 'min' for col in PERIODOS_CONTRATO}
+    agg.update({'materia': 'first', 'numero_contrato': 'first'})
+    df = df.groupby(['num_evento', 'ID', ], as_index=False).agg(agg)
+    df = df.assign(materia=df.materia.replace('Dos Bocas', 'Obra pública'))
+    df = (df.loc[~df.materia.isna()]
+          .sort_values('materia', kind='mergesort')
+          .reset_index(drop=True))
+    return df
+
+
+def periodos_cortos_contratos(
+        procedimientos: pd.DataFrame,
+        cuantil_max: float = 0.1,
+        dias: Optional[pd.DataFrame] = None,
+        umbrales: Optional[pd.DataFrame] = None,
+        n_bootstrap: int = 0,
+        periodos: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """Calcula en una sola pasada las duraciones de PERIODOS_CONTRATO por
+    contrato y marca con 1 las que están debajo del cuantil_max de su
+    materia (features 3, 4 y 24).
+
+    Los cuantiles salen de un groupby('materia').transform('quantile') por
+    columna. Si se indica umbrales (materia, variable, umbral), por ejemplo
+    de umbrales.cuantiles_sketch, se usan esos en lugar de recalcular los
+    cuantiles. Si una materia no tiene umbral el feature binario queda nulo.
+    Con n_bootstrap > 0 se agrega la columna {feature}_estabilidad con la
+    proporción de réplicas bootstrap del cuantil que conservan la marca.
+    periodos limita el cálculo a esas llaves de PERIODOS_CONTRATO."""
+    if periodos is None:
+        periodos = list(PERIODOS_CONTRATO)
+    df = duraciones_por_contrato(procedimientos, dias)
+    grupos = df.groupby('materia')
+    final_cols = ['num_evento', 'numero_contrato']
+    for col in periodos:
+        col_binario = PERIODOS_CONTRATO[col][1]
+        if umbrales is None:
+            cuantil = grupos[col].transform('quantile', cuantil_max)
+            corto = (df[col] < cuantil).astype(int).where(~cuantil.isna())
+        else:
+            corto = marcar_con_umbrales(df, umbrales, ['materia'], col)
+        df[col_binario] = corto
+        final_cols += [col, col_binario]
+        if n_bootstrap > 0:
+            _, estabilidad = intervalos_bootstrap(
+                df, ['materia'], col, cuantil_max, n_bootstrap=n_bootstrap
+            )
+            df[f'{col_binario}_estabilidad'] = estabilidad
+            final_cols.append(f'{col_binario}_estabilidad')
+    feature = df.loc[:, final_cols]
+    return feature
+
+
+def sketch_periodos_contratos(
+        procedimientos: pd.DataFrame,
+        sketch: Optional[pd.DataFrame] = None,
+        compresion: int = 100
+) -> pd.DataFrame:
+    """Crea o actualiza el sketch por materia de las duraciones de
+    PERIODOS_CONTRATO. Para actualizarlo procedimientos solo debe traer
+    los contratos nuevos"""
+    df = duraciones_por_contrato(procedimientos)
+    return actualizar_sketch(
+        sketch, df, ['materia'], list(PERIODOS_CONTRATO), compresion
+    )
+
+
 def diferencia_fecha_junta_fecha_convocatoria(
         procedimientos: pd.DataFrame,
-        cuantil_max: float = 0.1
+        cuantil_max: float = 0.1,
+        dias: Optional[pd.DataFrame] = None
 ) -> pd.DataFrame:
     # feature 3
-    cols = [
-        'ID', 'num_evento', 'materia', 'numero_contrato',
-        'fecha_junta_aclaraciones', 'fecha_convocatoria'
-    ]
-    df = procedimientos.loc[:, cols]
-    dif = (df.fecha_junta_aclaraciones - df.fecha_convocatoria).dt.days
-    df = df.assign(diferencia_fecha_junta_fecha_convocatoria=dif)
-    # se agrupan los consorcios
-    df = (df.groupby(['num_evento', 'ID', ], as_index=False)
-          .agg({'diferencia_fecha_junta_fecha_convocatoria': 'min',
-                'materia': 'unique', 'numero_contrato': 'unique'}))
-    materia = (df.materia.map(lambda m: m[0] if m else m)
-               .replace('Dos Bocas', 'Obra pública'))
-    df = df.assign(
-        materia=materia,
-        numero_contrato=df.numero_contrato.map(lambda c: c[0] if c else c),
+    feature = periodos_cortos_contratos(
+        procedimientos, cuantil_max, dias, periodos=['diferencia_fecha_junta_fecha_convocatoria']
     )
-    dfs = []
-    for g, df_group in df.groupby('materia'):
-        diferencia = df_group.diferencia_fecha_junta_fecha_convocatoria
-        cuantil = diferencia.dropna().quantile(cuantil_max)
-        if not pd.isna(cuantil):
-            cond = (diferencia < cuantil).astype(int)
-            df_group = df_group.assign(
-                periodo_corto_fecha_junta_fecha_convocatoria=cond
-            )
-        dfs.append(df_group)
-    feature = pd.concat(dfs, axis=0, ignore_index=True)
     final_cols = [
         'num_evento', 'numero_contrato',
         'diferencia_fecha_junta_fecha_convocatoria',
@@ -72,37 +175,14 @@ def diferencia_fecha_junta_fecha_convocatoria(
 
 def diferencia_fecha_contrato_fecha_junta(
         procedimientos: pd.DataFrame,
-        cuantil_max: float = 0.1
+        cuantil_max: float = 0.1,
+        dias: Optional[pd.DataFrame] = None
 ) -> pd.DataFrame:
     # TODO: tener cuidado al usar numero de contrato porque se va Dos Bocas
     # feature 4
-    cols = [
-        'ID', 'num_evento', 'numero_contrato', 'materia',
-        'fecha_junta_aclaraciones', 'fecha_del_contrato'
-    ]
-    df = procedimientos.loc[:, cols]
-    dif = (df.fecha_del_contrato - df.fecha_junta_aclaraciones).dt.days
-    df = df.assign(diferencia_fecha_contrato_fecha_junta=dif)
-    df = (df.groupby(['num_evento', 'ID', ], as_index=False)
-          .agg({'diferencia_fecha_contrato_fecha_junta': 'min',
-                'materia': 'unique', 'numero_contrato': 'unique'}))
-    materia = (df.materia.map(lambda m: m[0] if m else m)
-               .replace('Dos Bocas', 'Obra pública'))
-    df = df.assign(
-        materia=materia,
-        numero_contrato=df.numero_contrato.map(lambda c: c[0] if c else c),
+    feature = periodos_cortos_contratos(
+        procedimientos, cuantil_max, dias, periodos=['diferencia_fecha_contrato_fecha_junta']
     )
-    dfs = []
-    for g, df_group in df.groupby('materia'):
-        diferencia = df_group.diferencia_fecha_contrato_fecha_junta
-        cuantil = diferencia.dropna().quantile(cuantil_max)
-        if not pd.isna(cuantil):
-            cond = (diferencia < cuantil).astype(int)
-            df_group = df_group.assign(
-                periodo_corto_fecha_contrato_fecha_junta=cond
-            )
-        dfs.append(df_group)
-    feature = pd.concat(dfs, axis=0, ignore_index=True)
     final_cols = [
         'num_evento', 'numero_contrato',
         'diferencia_fecha_contrato_fecha_junta',
@@ -123,36 +203,13 @@ def con_convenios_modificatorios(procedimientos: pd.DataFrame) -> pd.DataFrame:
 
 
 def diferencia_fecha_termino_e_inicio_plazo(
-        procedimientos: pd.DataFrame, cuantil_max: float = 0.1) -> pd.DataFrame:
+        procedimientos: pd.DataFrame,
+        cuantil_max: float = 0.1,
+        dias: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     # feature 24
-    cols = [
-        'ID', 'num_evento', 'numero_contrato', 'materia',
-        'fecha_inicio_plazo_entrega', 'fecha_termino_plazo_entrega'
-    ]
-    df = procedimientos.loc[:, cols]
-    dif = (df.fecha_termino_plazo_entrega - df.fecha_inicio_plazo_entrega).dt.days
-    df = df.assign(diferenica_plazo_entrega=dif)
-    # se agrupan los consorcios
-    df = (df.groupby(['num_evento', 'ID', ], as_index=False)
-          .agg({'diferenica_plazo_entrega': 'min',
-                'materia': 'unique', 'numero_contrato': 'unique'}))
-    materia = (df.materia.map(lambda m: m[0] if m else m)
-               .replace('Dos Bocas', 'Obra pública'))
-    df = df.assign(
-        materia=materia,
-        numero_contrato=df.numero_contrato.map(lambda c: c[0] if c else c),
+    feature = periodos_cortos_contratos(
+        procedimientos, cuantil_max, dias, periodos=['diferenica_plazo_entrega']
     )
-    dfs = []
-    for g, df_group in df.groupby('materia'):
-        diferencia = df_group.diferenica_plazo_entrega
-        cuantil = diferencia.dropna().quantile(cuantil_max)
-        if not pd.isna(cuantil):
-            cond = (diferencia < cuantil).astype(int)
-            df_group = df_group.assign(
-                plazo_corto_entrega=cond
-            )
-        dfs.append(df_group)
-    feature = pd.concat(dfs, axis=0, ignore_index=True)
     final_cols = [
         'num_evento', 'numero_contrato',
         'diferenica_plazo_entrega',
@@ -161,3 +218,48 @@ def diferencia_fecha_termino_e_inicio_plazo(
     feature = feature.loc[:, final_cols]
     return feature
 
+
+def posible_fraccionamiento(
+        procedimientos: pd.DataFrame,
+        ventana: int = 30,
+        cuantil_umbral: float = 0.9,
+        fecha_col: str = 'fecha_del_contrato',
+        descripcion_col: Optional[str] = None,
+        similitud_min: float = 0.5) -> pd.DataFrame:
+    """Marca con 1 los contratos adjudicados directamente que, junto con
+    otras adjudicaciones directas a la misma empresa de la misma
+    empresa_productiva y materia en los ventana días anteriores, suman más
+    que el cuantil_umbral de las adjudicaciones directas de su
+    (empresa_productiva, materia), aunque el contrato solo no lo rebase.
+    Los contratos que no son adjudicación directa tienen 0.
+
+    Por default no se usa la similitud de descripciones: la tabla del inai
+    no trae una columna de descripción, así que la materia es lo único que
+    agrupa contratos del mismo tipo. Con descripcion_col solo se suman las
+    adjudicaciones seguidas con descripción parecida; la similitud se
+    compara con la adjudicación anterior del grupo y no con toda la
+    ventana, por lo que una adjudicación distinta en medio corta la serie
+    (ver fraccionamiento.fraccionamiento)"""
+    rs = 'razon_social_simple'
+    llaves = [rs, 'empresa_productiva', 'materia']
+    cols = ['num_evento', 'numero_contrato', 'tipo_procedimiento', 'monto', fecha_col] + llaves
+    if descripcion_col is not None:
+        cols.append(descripcion_col)
+    contratos = procedimientos.loc[:, ['num_evento', 'numero_contrato']].drop_duplicates()
+    cond = procedimientos.tipo_procedimiento == 'Adjudicación directa'
+    adjudicaciones = (procedimientos.loc[cond, cols]
+                      .dropna(subset=llaves + ['monto', fecha_col])
+                      .drop_duplicates(['num_evento', 'numero_contrato', rs]))
+    adjudicaciones = fraccionamiento(
+        adjudicaciones, llaves, fecha_col, ventana,
+        descripcion_col=descripcion_col, similitud_min=similitud_min,
+        llaves_umbral=['empresa_productiva', 'materia'],
+        cuantil_umbral=cuantil_umbral
+    )
+    marcas = (adjudicaciones.groupby(['num_evento', 'numero_contrato'], as_index=False)
+              .posible_fraccionamiento.max())
+    feature = pd.merge(contratos, marcas, 'left', on=['num_evento', 'numero_contrato'])
+    feature = feature.assign(
+        posible_fraccionamiento=feature.posible_fraccionamiento.fillna(0).astype(int)
+    )
+    return feature
@@ -1,32 +1,104 @@
 """Funciones para calcular los features a nivel proveedor"""
-import itertools
 import numpy as np
 import pandas as pd
-from collections import defaultdict, Counter
+from scipy import sparse
+from typing import Dict, List, Optional, Set, Tuple, Union
+from ..colusion import cobertura_por_empresa
+from ..proyeccion import lee_columnas
+from .ofertas import (TablaOfertas, separar_consorcios, tabla_ofertas,
+                      tabla_participantes)
+from .permutaciones import pvalores_coparticipacion
+from .umbrales import intervalos_bootstrap
+
+
+# feature -> función que lo calcula. Las familias share_empresa_monto y
+# share_empresa_contratos seleccionan todas las columnas
+# share_empresa_{monto|contratos}_{empresa_productiva}_{materia}
+COLUMNAS_PROVEEDOR: Dict[str, str] = {
+    'no_en_padron_proveedores': 'padron',
+    'es_empresa_fantasma': 'fantasma',
+    'empresa_no_localizada': 'no_localizada',
+    'tasa_exito': 'tasa_exito',
+    'tasa_exito_alta': 'tasa_exito',
+    'fecha_creacion_rfc': 'reciente',
+    'empresa_reciente': 'reciente',
+    'share_empresa_contratos': 'market_share_contratos',
+    'market_share_contratos_riesgoso': 'market_share_contratos',
+    'share_empresa_monto': 'market_share_monto',
+    'market_share_monto_riesgoso': 'market_share_monto',
+    'misma_competencia_y_tasa_exito_alta': 'participacion_conjunta',
+    'empresa_sancionada': 'sancionados',
+    'beneficiario_ofertas_cobertura': 'ofertas_cobertura',
+}
+
+FEATURES_BINARIOS_PROVEEDOR: List[str] = [
+    'no_en_padron_proveedores',
+    'es_empresa_fantasma',
+    'empresa_no_localizada',
+    'tasa_exito_alta',
+    'empresa_reciente',
+    'market_share_contratos_riesgoso',
+    'market_share_monto_riesgoso',
+    'misma_competencia_y_tasa_exito_alta',
+    'empresa_sancionada',
+]
 
 
 def features_binarios_proveedores(
         procedimientos: pd.DataFrame,
-        ofertas: pd.DataFrame,
+        ofertas: Union[pd.DataFrame, TablaOfertas],
         proveedores_fantasma: pd.DataFrame,
         proveedores_no_localizados: pd.DataFrame,
         proveedores_sancionados: pd.DataFrame,
         particulares_sancionados: pd.DataFrame,
         padron_proveedores: pd.DataFrame,
-        n_proveedores: int = 1089) -> pd.DataFrame:
-    dfs = [
-        empresa_no_en_padron_proveedores(procedimientos, padron_proveedores),
-        reportada_como_empresa_fantasma(procedimientos, proveedores_fantasma),
-        empresa_no_localizada_sat(procedimientos, proveedores_no_localizados),
-        tasa_exito_proveedor(procedimientos, ofertas, 0.5),
-        empresa_creada_recientemente(procedimientos),
-        market_share_por_contratos(procedimientos),
-        market_share_por_monto(procedimientos),
-        participacion_conjunta_sospechosa(procedimientos, ofertas, 5, 0.5, 0.5),
-        proveedores_y_particulares_sancionados(
-            procedimientos, proveedores_sancionados, particulares_sancionados
-        ),
-    ]
+        n_proveedores: int = 1089,
+        fecha_col: Optional[str] = None,
+        columnas: Optional[Set[str]] = None,
+        path_cache_ofertas: Optional[str] = None) -> pd.DataFrame:
+    # con fecha_col los listados de fantasmas y sancionados se cruzan
+    # con la fecha de cada contrato (ver en_listado_a_la_fecha)
+    # columnas indica los features que se necesitan (ver COLUMNAS_PROVEEDOR),
+    # solo se calculan las funciones que los generan. Los nombres que no
+    # son de este nivel se ignoran. Por default son los features binarios
+    # la tabla de ofertas se normaliza una sola vez para todos los features
+    # (ver ofertas.tabla_ofertas), en path_cache_ofertas si se indica
+    if columnas is None:
+        columnas = set(FEATURES_BINARIOS_PROVEEDOR)
+    productores = {COLUMNAS_PROVEEDOR[c] for c in columnas if c in COLUMNAS_PROVEEDOR}
+    if productores & {'tasa_exito', 'participacion_conjunta', 'ofertas_cobertura'}:
+        ofertas = tabla_ofertas(ofertas, procedimientos, path_cache_ofertas)
+    dfs = []
+    if 'padron' in productores:
+        dfs.append(empresa_no_en_padron_proveedores(procedimientos, padron_proveedores))
+    if 'fantasma' in productores:
+        dfs.append(reportada_como_empresa_fantasma(
+            procedimientos, proveedores_fantasma, fecha_col
+        ))
+    if 'no_localizada' in productores:
+        dfs.append(empresa_no_localizada_sat(procedimientos, proveedores_no_localizados))
+    if 'tasa_exito' in productores:
+        dfs.append(tasa_exito_proveedor(procedimientos, ofertas, 0.5))
+    if 'reciente' in productores:
+        dfs.append(empresa_creada_recientemente(procedimientos))
+    tipos = tuple(t for t in ['contratos', 'monto']
+                  if f'market_share_{t}' in productores)
+    if len(tipos):
+        # las columnas share_empresa_* solo se pivotean si se pidió su familia
+        shares_empresa = tuple(t for t in tipos if f'share_empresa_{t}' in columnas)
+        dfs.append(market_share(procedimientos, tipos=tipos,
+                                shares_empresa=shares_empresa))
+    if 'participacion_conjunta' in productores:
+        dfs.append(participacion_conjunta_sospechosa(procedimientos, ofertas, 5, 0.5, 0.5))
+    if 'sancionados' in productores:
+        dfs.append(proveedores_y_particulares_sancionados(
+            procedimientos, proveedores_sancionados, particulares_sancionados,
+            fecha_col
+        ))
+    if 'ofertas_cobertura' in productores:
+        dfs.append(beneficiario_ofertas_cobertura(procedimientos, ofertas))
+    if not len(dfs):
+        return procedimientos.loc[:, ['razon_social_simple']].dropna().drop_duplicates()
     dfs = [df.set_index('razon_social_simple') for df in dfs]
     if not all([df.shape[0] == n_proveedores for df in dfs]):
         m = ('Existen shapes que no son iguales al número de proveedores indicado. '
@@ -35,42 +107,16 @@ def features_binarios_proveedores(
     df_features_proveedores = (pd.concat(dfs, axis=1, ignore_index=False)
                                .reset_index()
                                .rename(columns={'index': 'razon_social_simple'}))
-    cols = [
-        'tasa_exito',
-        'fecha_creacion_rfc',
-        # market share monto
-        'share_empresa_monto_pep_adquisiciones',
-        'share_empresa_monto_pep_arrendamientos',
-        'share_empresa_monto_pep_obra_pública',
-        'share_empresa_monto_pep_servicios',
-        'share_empresa_monto_plo_adquisiciones',
-        'share_empresa_monto_plo_servicios',
-        'share_empresa_monto_pmx_adquisiciones',
-        'share_empresa_monto_pmx_servicios',
-        'share_empresa_monto_pti_obra_pública',
-        'share_empresa_monto_ptri_adquisiciones',
-        'share_empresa_monto_ptri_arrendamientos',
-        'share_empresa_monto_ptri_obra_pública',
-        'share_empresa_monto_ptri_servicios',
-        # market share contratos
-        'share_empresa_contratos_pep_adquisiciones',
-        'share_empresa_contratos_pep_arrendamientos',
-        'share_empresa_contratos_pep_obra_pública',
-        'share_empresa_contratos_pep_servicios',
-        'share_empresa_contratos_plo_adquisiciones',
-        'share_empresa_contratos_plo_servicios',
-        'share_empresa_contratos_pmx_adquisiciones',
-        'share_empresa_contratos_pmx_servicios',
-        'share_empresa_contratos_pti_obra_pública',
-        'share_empresa_contratos_ptri_adquisiciones',
-        'share_empresa_contratos_ptri_arrendamientos',
-        'share_empresa_contratos_ptri_obra_pública',
-        'share_empresa_contratos_ptri_servicios',
+    familias = [c for c in columnas if c.startswith('share_empresa_')]
+    cols = ['razon_social_simple'] + [
+        c for c in df_features_proveedores.columns
+        if c in columnas or any(c.startswith(f'{f}_') for f in familias)
     ]
-    df_features_proveedores = df_features_proveedores.drop(cols, axis=1)
+    df_features_proveedores = df_features_proveedores.loc[:, cols]
     return df_features_proveedores
 
 
+@lee_columnas('razon_social_simple', 'RFC', 'fecha_creacion_rfc', 'numero_contrato')
 def empresa_creada_recientemente(procedimientos: pd.DataFrame,
                                  fecha_max: str = '2018-01-01') -> pd.DataFrame:
     # FIXME: algunas empresas tienen más de un RFC. Puede ser error de captura
@@ -92,9 +138,23 @@ def empresa_creada_recientemente(procedimientos: pd.DataFrame,
     return feature
 
 
+def participantes_por_contrato(
+        ofertas: Union[pd.DataFrame, TablaOfertas]) -> pd.DataFrame:
+    """Tabla (numero_contrato, razon_social_simple) con un renglón por
+    empresa participante. Los consorcios ('A / B') se separan en sus
+    empresas y se conserva cada aparición, por lo que una empresa puede
+    aparecer más de una vez en el mismo contrato. Si ofertas ya es una
+    TablaOfertas no se vuelve a normalizar"""
+    if isinstance(ofertas, TablaOfertas):
+        return tabla_participantes(ofertas)
+    participantes = separar_consorcios(ofertas)
+    return participantes.loc[:, ['numero_contrato', 'razon_social_simple']]
+
+
+@lee_columnas('razon_social_simple', 'tipo_procedimiento', 'numero_contrato')
 def tasa_exito_proveedor(
         procedimientos: pd.DataFrame,
-        ofertas: pd.DataFrame,
+        ofertas: Union[pd.DataFrame, TablaOfertas],
         threshold: float) -> pd.DataFrame:
     # feature 19
     rs = 'razon_social_simple'
@@ -106,22 +166,15 @@ def tasa_exito_proveedor(
                     .rename(columns={'numero_contrato': 'contratos_ganados'}))
     df_ganadores = df_ganadores.loc[df_ganadores.razon_social_simple != 'S']
     ganadores = df_ganadores.razon_social_simple.unique()
-    ofertas = ofertas.loc[:, ['numero_contrato', rs]].drop_duplicates()
-    participaciones = defaultdict(int)
-    for contrato, participantes in ofertas.groupby('numero_contrato'):
-        conjunto = participantes[rs].values
-        conjunto = itertools.chain.from_iterable(e.split('/') for e in conjunto)
-        conjunto = [e.strip() for e in conjunto]
-        for g, p in itertools.product(ganadores, conjunto):
-            cond = g == p
-            # cond = g in p
-            # caso con regex
-            if cond:
-                participaciones[g] += 1
-    df_participaciones = pd.DataFrame.from_dict(
-        participaciones, orient='index', columns=['participaciones']
-    )
-    df_participaciones = df_participaciones.reset_index().rename(columns={'index': rs})
+    # una participación por cada aparición del ganador en un contrato,
+    # incluyendo las que hace como parte de un consorcio
+    participantes = participantes_por_contrato(ofertas)
+    participaciones = (participantes.loc[participantes[rs].isin(ganadores), rs]
+                       .value_counts())
+    df_participaciones = pd.DataFrame({
+        rs: participaciones.index.to_numpy(),
+        'participaciones': participaciones.to_numpy(),
+    })
     df_join = pd.merge(df_ganadores, df_participaciones, on=rs, how='left')
     df_join = df_join.loc[~df_join.participaciones.isna()]
     # no puede ser que haya más contratos ganados que participaciones
@@ -136,14 +189,14 @@ def tasa_exito_proveedor(
     return df_join
 
 
+@lee_columnas('RFC', 'razon_social_simple')
 def empresa_no_en_padron_proveedores(
         df: pd.DataFrame,
         listado_proveedores: pd.DataFrame) -> pd.DataFrame:
     # feature 8
     listado_proveedores_nombre = listado_proveedores['razon_social'].unique()
     listado_proveedores_rfc = listado_proveedores['RFC'].unique()
-    data = df.copy()
-    data = data.loc[:, ['RFC', 'razon_social_simple']]
+    data = df
     # Realizar revisión por nombre y por RFC
     not_in_contractors_list_1 = np.where(
         data.razon_social_simple.isin(listado_proveedores_nombre), 0, 1
@@ -168,21 +221,100 @@ def empresa_no_en_padron_proveedores(
     return feature
 
 
+def coalescer_intervalos(listado: pd.DataFrame, llave: str) -> pd.DataFrame:
+    """Une los intervalos [fecha_inicio, fecha_fin) que se traslapan para
+    cada valor de la llave. Las fechas nulas se toman como intervalos
+    abiertos. Regresa una tabla con llave, fecha_inicio y fecha_fin sin
+    traslapes, ordenada por llave y fecha_inicio"""
+    intervalos = listado.loc[:, [llave]].dropna().drop_duplicates()
+    if 'fecha_inicio' not in listado.columns:
+        # listado sin fechas: vigente siempre
+        return intervalos.assign(fecha_inicio=pd.Timestamp.min,
+                                 fecha_fin=pd.Timestamp.max)
+    intervalos = listado.loc[:, [llave, 'fecha_inicio', 'fecha_fin']].dropna(
+        subset=[llave]
+    )
+    intervalos = intervalos.assign(
+        fecha_inicio=intervalos.fecha_inicio.fillna(pd.Timestamp.min),
+        fecha_fin=intervalos.fecha_fin.fillna(pd.Timestamp.max),
+    ).sort_values([llave, 'fecha_inicio'])
+    # un intervalo empieza un bloque nuevo si inicia después de que
+    # terminaron todos los anteriores de la misma llave
+    fin_previo = (intervalos.groupby(llave).fecha_fin.cummax()
+                  .groupby(intervalos[llave]).shift())
+    nuevo_bloque = fin_previo.isna() | (intervalos.fecha_inicio > fin_previo)
+    intervalos = (intervalos.assign(bloque=nuevo_bloque.cumsum())
+                  .groupby([llave, 'bloque'], as_index=False)
+                  .agg({'fecha_inicio': 'min', 'fecha_fin': 'max'})
+                  .drop('bloque', axis=1))
+    return intervalos
+
+
+def en_listado_a_la_fecha(df: pd.DataFrame,
+                          columna: str,
+                          listado: pd.DataFrame,
+                          llave: str,
+                          fecha_col: str) -> np.ndarray:
+    """Indica con 1 los renglones de df cuyo valor en columna estaba
+    vigente en el listado en la fecha de fecha_col.
+
+    Los intervalos del listado se coalescen por llave y se cruzan con un
+    merge_asof (último intervalo que inició antes de la fecha), por lo que
+    el costo es O((n + m) log(n + m)) en lugar de un producto cruz."""
+    marcas = np.zeros(df.shape[0], dtype=int)
+    intervalos = coalescer_intervalos(listado, llave).rename(
+        columns={llave: '_llave'}
+    )
+    registros = pd.DataFrame({
+        '_llave': df[columna].to_numpy(),
+        '_fecha': df[fecha_col].to_numpy(),
+        '_posicion': np.arange(df.shape[0]),
+    }).dropna(subset=['_llave', '_fecha'])
+    if registros.shape[0] == 0 or intervalos.shape[0] == 0:
+        return marcas
+    registros = registros.astype({'_llave': str, '_fecha': 'datetime64[ns]'})
+    intervalos = intervalos.astype({'_llave': str,
+                                    'fecha_inicio': 'datetime64[ns]',
+                                    'fecha_fin': 'datetime64[ns]'})
+    cruce = pd.merge_asof(
+        registros.sort_values('_fecha'),
+        intervalos.sort_values('fecha_inicio'),
+        left_on='_fecha',
+        right_on='fecha_inicio',
+        by='_llave',
+        direction='backward',
+    )
+    vigente = cruce.fecha_fin.notna() & (cruce._fecha < cruce.fecha_fin)
+    marcas[cruce.loc[vigente, '_posicion'].to_numpy()] = 1
+    return marcas
+
+
+@lee_columnas('RFC', 'razon_social_simple', opcionales=('fecha_col',))
 def reportada_como_empresa_fantasma(df: pd.DataFrame,
-                                    listado_fantasmas: pd.DataFrame) -> pd.DataFrame:
+                                    listado_fantasmas: pd.DataFrame,
+                                    fecha_col: Optional[str] = None) -> pd.DataFrame:
     # feature 9
+    # Si se indica fecha_col, listado_fantasmas debe traer el periodo de
+    # cada situación (ver cargar_intervalos_69b) y solo se marca al
+    # proveedor si era presunto o definitivo en la fecha del contrato
     estatus_fantasma = {'Definitivo', 'Presunto'}
     # Filtrar base de fantasma para definitivos y presuntos
-    fantasmas = listado_fantasmas.copy()
-    fantasmas = fantasmas[fantasmas['situacion_contribuyente'].isin(estatus_fantasma)]
+    fantasmas = listado_fantasmas.loc[
+        listado_fantasmas['situacion_contribuyente'].isin(estatus_fantasma)
+    ]
     # Crear listas
     fantasma_rfc = fantasmas['RFC'].unique()
     fantasma_nombre = fantasmas['razon_social'].unique()
     # Unir con base de contratos
-    data = df.copy()
-    data = data.loc[:, ['RFC', 'razon_social_simple']]
-    is_phantom_1 = np.where(data['razon_social_simple'].isin(fantasma_nombre), 1, 0)
-    is_phantom_2 = np.where(data['RFC'].isin(fantasma_rfc), 1, 0)
+    data = df
+    if fecha_col is None:
+        is_phantom_1 = np.where(data['razon_social_simple'].isin(fantasma_nombre), 1, 0)
+        is_phantom_2 = np.where(data['RFC'].isin(fantasma_rfc), 1, 0)
+    else:
+        is_phantom_1 = en_listado_a_la_fecha(
+            data, 'razon_social_simple', fantasmas, 'razon_social', fecha_col
+        )
+        is_phantom_2 = en_listado_a_la_fecha(data, 'RFC', fantasmas, 'RFC', fecha_col)
     data = data.assign(is_phantom_1=is_phantom_1, is_phantom_2=is_phantom_2)
     # Agrupar por razón social simple
     data_grouped = (data.groupby('razon_social_simple')
@@ -197,6 +329,7 @@ def reportada_como_empresa_fantasma(df: pd.DataFrame,
     return feature
 
 
+@lee_columnas('RFC', 'razon_social_simple')
 def empresa_no_localizada_sat(df: pd.DataFrame,
                               no_localizados: pd.DataFrame) -> pd.DataFrame:
     # feature 10
@@ -204,8 +337,7 @@ def empresa_no_localizada_sat(df: pd.DataFrame,
     no_localizados_rfc = no_localizados.RFC
     no_localizados_nombre = no_localizados.razon_social
     # Unir con base de contratos
-    data = df.copy()
-    data = data.loc[:, ['RFC', 'razon_social_simple']]
+    data = df
     is_not_found_1 = np.where(
         data.razon_social_simple.isin(no_localizados_nombre), 1, 0
     )
@@ -224,11 +356,16 @@ def empresa_no_localizada_sat(df: pd.DataFrame,
     return feature
 
 
+@lee_columnas('RFC', 'razon_social_simple', opcionales=('fecha_col',))
 def proveedores_y_particulares_sancionados(df: pd.DataFrame,
                                            proveedores_sancionados: pd.DataFrame,
-                                           particulares_sancionados: pd.DataFrame):
+                                           particulares_sancionados: pd.DataFrame,
+                                           fecha_col: Optional[str] = None):
     # TODO: de donde sale la de particulares sancionados?
     # feature 11
+    # Si se indica fecha_col se usa el periodo de la sanción (columnas
+    # fecha_inicio y fecha_fin de cada listado). Los listados sin esas
+    # columnas se consideran vigentes en cualquier fecha
     # Listado de proveedores sancionados
     listado_sancionados_1 = proveedores_sancionados['razon_social'].unique()
     listado_sancionados_2 = particulares_sancionados['razon_social'].unique()
@@ -245,14 +382,29 @@ def proveedores_y_particulares_sancionados(df: pd.DataFrame,
     # listado_proveedores_2_rfc = listado_proveedores_2['RFC']
     # listado_proveedores_2_nombre = listado_proveedores_2['razon_social']
     # Unir con base de contratos
-    data = df.copy()
-    data = data.loc[:, ['RFC', 'razon_social_simple']]
-    data['sanctioned_1'] = np.where(
-        data['razon_social_simple'].isin(listado_sancionados_1), 1, 0
-    )
-    data['sanctioned_2'] = np.where(
-        data['razon_social_simple'].isin(listado_sancionados_2), 1, 0
-    )
+    data = df
+    if fecha_col is not None:
+        data['sanctioned_1'] = en_listado_a_la_fecha(
+            data, 'razon_social_simple', proveedores_sancionados,
+            'razon_social', fecha_col
+        )
+        data['sanctioned_2'] = en_listado_a_la_fecha(
+            data, 'razon_social_simple', particulares_sancionados,
+            'razon_social', fecha_col
+        )
+        data['sanctioned_3'] = en_listado_a_la_fecha(
+            data, 'RFC', particulares_sancionados, 'RFC', fecha_col
+        )
+    else:
+        data['sanctioned_1'] = np.where(
+            data['razon_social_simple'].isin(listado_sancionados_1), 1, 0
+        )
+        data['sanctioned_2'] = np.where(
+            data['razon_social_simple'].isin(listado_sancionados_2), 1, 0
+        )
+        data['sanctioned_3'] = np.where(
+            data['RFC'].isin(listado_sancionados_3), 1, 0
+        )
     # data['sanctioned_3'] = np.where(
     #     data['razon_social_simple'].isin(listado_proveedores_1_nombre), 1, 0
     # )
@@ -262,10 +414,6 @@ def proveedores_y_particulares_sancionados(df: pd.DataFrame,
     # data['sanctioned_5'] = np.where(data['RFC'].isin(listado_proveedores_1_rfc), 1, 0)
     # data['sanctioned_6'] = np.where(data['RFC'].isin(listado_proveedores_2_rfc), 1, 0)
 
-    data['sanctioned_3'] = np.where(
-        data['RFC'].isin(listado_sancionados_3), 1, 0
-    )
-
     # Agrupar por razón social simple
     data_grouped = (data.groupby('razon_social_simple')
                     .agg({'sanctioned_1': 'sum',
@@ -288,179 +436,253 @@ def proveedores_y_particulares_sancionados(df: pd.DataFrame,
     return feature
 
 
-def market_share_por_monto(procedimientos: pd.DataFrame,
-                           cuantil_min=0.9) -> pd.DataFrame:
-    # feature 17
-    data = procedimientos.copy()
-    empresas = data.loc[:, ['razon_social_simple']].dropna().drop_duplicates()
-    # Agrupar por empresa, materia y proveedor
-    cols_group = ['empresa_productiva', 'materia', 'razon_social_simple']
-    data_grouped = (data.groupby(cols_group)
-                    .agg({'monto': 'sum', 'ID': 'nunique'}).reset_index())
-    # Crear columna de monto total
-    totales = (data.groupby(['empresa_productiva', 'materia'])
-               .agg({'monto': 'sum', 'ID': 'nunique'}).reset_index())
-    totales = totales.rename(
-        columns={'monto': 'monto_total', 'ID': 'contratos_total'}
-    )
-    # Unir tablas
-    data_final = pd.merge(
-        data_grouped, totales, how='left', on=['empresa_productiva', 'materia']
-    )
+def shares_por_grupo(procedimientos: pd.DataFrame,
+                     contratos_min: int = 6) -> pd.DataFrame:
+    """Share por monto y por contratos de cada empresa en cada
+    (empresa_productiva, materia) con al menos contratos_min contratos.
+    Se agrupa una sola vez por empresa y una por grupo"""
+    llaves = ['empresa_productiva', 'materia']
+    data = (procedimientos.groupby(llaves + ['razon_social_simple'])
+            .agg({'monto': 'sum', 'ID': 'nunique'}).reset_index())
+    totales = (procedimientos.groupby(llaves)
+               .agg({'monto': 'sum', 'ID': 'nunique'}).reset_index()
+               .rename(columns={'monto': 'monto_total', 'ID': 'contratos_total'}))
+    data = pd.merge(data, totales, 'left', on=llaves)
     # se eliminan los grupos con pocos contratos
-    data_final = data_final.loc[data_final.contratos_total >= 6]
-    # Obtener shares
-    data_final['share_empresa'] = data_final['monto'] / data_final['monto_total']
-    dfs = []
-    for (e, m), df_group in data_final.groupby(['empresa_productiva', 'materia']):
-        cond = (data_final.empresa_productiva == e) & (data_final.materia == m)
-        cuantil = data_final.loc[cond].share_empresa.dropna().quantile(cuantil_min)
-        df_group = df_group.assign(
-            supera_umbral=(df_group.share_empresa > cuantil).astype(int)
-        )
-        col_share_tipo = f'share_empresa_monto_{e}_{"_".join(m.split())}'.lower()
-        df_group.loc[:, col_share_tipo] = df_group.share_empresa
-        dfs.append(df_group)
-    data_final = pd.concat(dfs, axis=0, ignore_index=True)
-    cols_to_sum = [c for c in data_final.columns if c.startswith('share_empresa_')]
-    cols_to_sum.append('supera_umbral')
-    feature = (data_final.groupby('razon_social_simple', as_index=False)
-               .agg({c: 'sum' for c in cols_to_sum}))
-    feature['market_share_monto_riesgoso'] = np.where(
-        feature['supera_umbral'] >= 1, 1, 0
+    data = data.loc[data.contratos_total >= contratos_min]
+    data = data.assign(
+        share_monto=data.monto / data.monto_total,
+        share_contratos=data.ID / data.contratos_total,
     )
-    feature = pd.merge(empresas, feature, 'left', on='razon_social_simple')
-    feature = feature.drop('supera_umbral', axis=1)
+    return data
+
+
+@lee_columnas('empresa_productiva', 'materia', 'razon_social_simple', 'monto', 'ID')
+def market_share(procedimientos: pd.DataFrame,
+                 cuantil_min=0.9,
+                 umbrales_monto: Optional[pd.DataFrame] = None,
+                 umbrales_contratos: Optional[pd.DataFrame] = None,
+                 n_bootstrap: int = 0,
+                 tipos: Tuple[str, ...] = ('monto', 'contratos'),
+                 shares_empresa: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """Features 17 y 18: market share por monto y por contratos.
+
+    Una empresa es riesgosa si su share supera el cuantil cuantil_min de
+    su grupo (empresa_productiva, materia) en alguno de sus grupos. Los
+    cuantiles salen de un solo groupby.transform y las columnas
+    share_empresa_{monto|contratos}_{empresa_productiva}_{materia} de un
+    solo pivoteo.
+
+    Parameters
+    ----------
+    umbrales_monto, umbrales_contratos: pd.DataFrame, opcional
+        (empresa_productiva, materia, umbral) reemplaza al cuantil
+        calculado con toda la historia, ver umbrales.cuantiles_sketch
+    n_bootstrap: int
+        Si es mayor a cero se agrega la estabilidad de cada feature: la
+        mínima entre los grupos de la empresa (ver
+        umbrales.intervalos_bootstrap)
+    tipos: tuple
+        Features a calcular: 'monto' y/o 'contratos'
+    shares_empresa: tuple, opcional
+        Tipos de los que se pivotean las columnas share_empresa_*. Por
+        default todos los de tipos; con una tupla vacía solo se calculan
+        las columnas market_share_{tipo}_riesgoso
+    """
+    rs = 'razon_social_simple'
+    llaves = ['empresa_productiva', 'materia']
+    empresas = procedimientos.loc[:, [rs]].dropna().drop_duplicates()
+    data = shares_por_grupo(procedimientos)
+    data = data.sort_values(llaves + [rs], kind='mergesort')
+    umbrales_tipo = {'monto': umbrales_monto, 'contratos': umbrales_contratos}
+    if shares_empresa is None:
+        shares_empresa = tipos
+    if len(shares_empresa):
+        grupo = data.empresa_productiva + '_' + data.materia.str.split().str.join('_')
+    features = []
+    for tipo in tipos:
+        umbrales = umbrales_tipo[tipo]
+        share = f'share_{tipo}'
+        feature = f'market_share_{tipo}_riesgoso'
+        if umbrales is None:
+            cuantil = data.groupby(llaves)[share].transform('quantile', cuantil_min)
+        else:
+            cuantil = pd.merge(data.loc[:, llaves],
+                               umbrales.loc[:, llaves + ['umbral']],
+                               'left', on=llaves).umbral.to_numpy()
+        data = data.assign(supera_umbral=(data[share] > cuantil).astype(int))
+        riesgoso = data.groupby(rs).supera_umbral.max()
+        if tipo in shares_empresa:
+            data = data.assign(columna=(f'share_empresa_{tipo}_' + grupo).str.lower())
+            columnas = data.columna.drop_duplicates()
+            shares = (data.groupby([rs, 'columna'])[share].sum()
+                      .unstack('columna', fill_value=0)
+                      .reindex(columns=columnas))
+            shares.columns.name = None
+            shares[feature] = riesgoso
+        else:
+            shares = riesgoso.to_frame(feature)
+        if n_bootstrap > 0:
+            _, estabilidad = intervalos_bootstrap(
+                data, llaves, share, cuantil_min, mayor=True,
+                n_bootstrap=n_bootstrap
+            )
+            shares[f'{feature}_estabilidad'] = estabilidad.groupby(data[rs]).min()
+        features.append(shares)
+    feature = pd.concat(features, axis=1).reset_index()
+    feature = pd.merge(empresas, feature, 'left', on=rs)
     return feature
 
 
-def market_share_por_contratos(df: pd.DataFrame, cuantil_min=0.9):
-    # feature 18
-    data = df.copy()
-    empresas = data.loc[:, ['razon_social_simple']].dropna().drop_duplicates()
-    # Agrupar por empresa, materia y proveedor
-    cols_group = ['empresa_productiva', 'materia', 'razon_social_simple']
-    data_grouped = (data.groupby(cols_group)
-                    .agg({'ID': 'nunique'})
-                    .reset_index())
-    # Crear columna de contratos totales
-    totales = (data.groupby(['empresa_productiva', 'materia'])
-               .agg({'ID': 'nunique'})
-               .reset_index())
-    totales = totales.rename(columns={'ID': 'contratos_total'})
-    # Unir tablas
-    data_final = pd.merge(
-        data_grouped, totales, 'left', on=['empresa_productiva', 'materia']
+def market_share_por_monto(procedimientos: pd.DataFrame,
+                           cuantil_min=0.9,
+                           umbrales: Optional[pd.DataFrame] = None,
+                           n_bootstrap: int = 0) -> pd.DataFrame:
+    # feature 17, ver market_share
+    return market_share(procedimientos, cuantil_min, umbrales_monto=umbrales,
+                        n_bootstrap=n_bootstrap, tipos=('monto',))
+
+
+def market_share_por_contratos(df: pd.DataFrame, cuantil_min=0.9,
+                               umbrales: Optional[pd.DataFrame] = None,
+                               n_bootstrap: int = 0):
+    # feature 18, ver market_share
+    return market_share(df, cuantil_min, umbrales_contratos=umbrales,
+                        n_bootstrap=n_bootstrap, tipos=('contratos',))
+
+
+@lee_columnas('razon_social_simple', 'tipo_procedimiento', 'numero_contrato')
+def coparticipacion_ganadores(
+        procedimientos: pd.DataFrame,
+        participantes: Union[pd.DataFrame, TablaOfertas],
+        repetidas: bool = True) -> pd.DataFrame:
+    """Participaciones de cada empresa ganadora y el mayor número de veces
+    que otra empresa participó en los mismos contratos que ella.
+
+    Se usa la matriz de incidencia A (empresa x contrato, con el número de
+    apariciones de la empresa en el contrato) en formato disperso. La
+    participación conjunta es B A^T, donde B son los renglones de A de las
+    empresas ganadoras con 1 en cada contrato donde aparecen. Solo se
+    guardan las entradas distintas de cero. Con repetidas=False A es
+    binaria y ambos conteos son de contratos distintos, como en
+    pvalores_participacion_conjunta.
+
+    Returns
+    -------
+    Tabla con razon_social_simple, participaciones,
+    max_participacion_conjunta (nulo si nunca participó con otra empresa)
+    y contratos_ganados, solo de los ganadores que aparecen en participantes
+    """
+    rs = 'razon_social_simple'
+    cond = procedimientos.tipo_procedimiento != 'Adjudicación directa'
+    ganadores = (procedimientos.loc[cond, [rs, 'numero_contrato']]
+                 .groupby(rs).numero_contrato.nunique())
+    tabla = tabla_ofertas(participantes)
+    empresas = pd.Index(tabla.empresas)
+    # las apariciones repetidas de una empresa en un contrato se suman,
+    # salvo con repetidas=False
+    incidencia = sparse.csr_matrix(
+        (np.ones(tabla.empresa.shape[0], dtype=np.int64),
+         (tabla.empresa, tabla.contrato)),
+        shape=(tabla.empresas.shape[0], tabla.contratos.shape[0])
     )
-    # se eliminan los grupos con pocos contratos
-    data_final = data_final.loc[data_final.contratos_total >= 6]
-    # Obtener shares
-    data_final['share_empresa'] = data_final['ID'] / data_final['contratos_total']
-    dfs = []
-    for (e, m), df_group in data_final.groupby(['empresa_productiva', 'materia']):
-        cond = (data_final.empresa_productiva == e) & (data_final.materia == m)
-        cuantil = data_final.loc[cond].share_empresa.dropna().quantile(cuantil_min)
-        df_group = df_group.assign(
-            supera_umbral=(df_group.share_empresa > cuantil).astype(int)
-        )
-        col_share_tipo = f'share_empresa_contratos_{e}_{"_".join(m.split())}'.lower()
-        df_group.loc[:, col_share_tipo] = df_group.share_empresa
-        dfs.append(df_group)
-    data_final = pd.concat(dfs, axis=0, ignore_index=True)
-    cols_to_sum = [c for c in data_final.columns if c.startswith('share_empresa_')]
-    cols_to_sum.append('supera_umbral')
-    feature = (data_final.groupby('razon_social_simple', as_index=False)
-               .agg({c: 'sum' for c in cols_to_sum}))
-    feature['market_share_contratos_riesgoso'] = np.where(
-        feature['supera_umbral'] >= 1, 1, 0
+    if not repetidas:
+        incidencia.data[:] = 1
+    filas = empresas.get_indexer(ganadores.index)
+    presentes = filas >= 0
+    filas = filas[presentes]
+    contratos_ganador = incidencia[filas]
+    contratos_ganador.data[:] = 1
+    conjunta = (contratos_ganador @ incidencia.T).tocsr()
+    # la diagonal (ganador consigo mismo) son sus participaciones
+    renglones = np.arange(filas.shape[0])
+    participaciones = np.asarray(conjunta[renglones, filas]).ravel()
+    conjunta[renglones, filas] = 0
+    conjunta.eliminate_zeros()
+    maximo = conjunta.max(axis=1).toarray().ravel().astype(float)
+    maximo[np.diff(conjunta.indptr) == 0] = np.nan
+    data = pd.DataFrame({
+        rs: ganadores.index[presentes],
+        'participaciones': participaciones,
+        'max_participacion_conjunta': maximo,
+        'contratos_ganados': ganadores.to_numpy()[presentes],
+    })
+    return data
+
+
+@lee_columnas('razon_social_simple', 'tipo_procedimiento', 'numero_contrato')
+def pvalores_participacion_conjunta(procedimientos: pd.DataFrame,
+                                    participantes: Union[pd.DataFrame, TablaOfertas],
+                                    n_permutaciones: int = 1000,
+                                    n_jobs: int = -1,
+                                    semilla: int = 0) -> pd.DataFrame:
+    """P-valor empírico de la participación conjunta de cada empresa
+    ganadora con cada otra participante, con el modelo nulo de
+    permutaciones.pvalores_coparticipacion (se conservan las
+    participaciones de cada empresa y el tamaño de cada contrato).
+
+    Returns
+    -------
+    Tabla con empresa_ganadora, empresa_participante,
+    participacion_conjunta (contratos en común) y p_valor
+    """
+    rs = 'razon_social_simple'
+    cond = procedimientos.tipo_procedimiento != 'Adjudicación directa'
+    ganadores = procedimientos.loc[cond, rs].dropna().unique()
+    tabla = tabla_ofertas(participantes)
+    empresas = pd.Index(tabla.empresas)
+    n_empresas = tabla.empresas.shape[0]
+    # pares (empresa, contrato) sin repetidos
+    llaves = np.unique(tabla.contrato.astype(np.int64) * n_empresas + tabla.empresa)
+    filas = empresas.get_indexer(ganadores)
+    filas = np.unique(filas[filas >= 0])
+    pares = pvalores_coparticipacion(
+        llaves % n_empresas, llaves // n_empresas, n_empresas,
+        tabla.contratos.shape[0], filas, n_permutaciones, n_jobs, semilla
     )
-    feature = feature.drop('supera_umbral', axis=1)
-    feature = pd.merge(empresas, feature, 'left', on='razon_social_simple')
-    return feature
+    pares = pares.assign(
+        empresa_ganadora=empresas[pares.empresa].to_numpy(),
+        empresa_participante=empresas[pares.otra_empresa].to_numpy(),
+    )
+    cols = ['empresa_ganadora', 'empresa_participante',
+            'participacion_conjunta', 'p_valor']
+    return pares.loc[:, cols]
 
 
+@lee_columnas('razon_social_simple', 'tipo_procedimiento', 'numero_contrato')
 def participacion_conjunta_sospechosa(
         procedimientos: pd.DataFrame,
-        participantes: pd.DataFrame,
+        participantes: Union[pd.DataFrame, TablaOfertas],
         participaciones_min: int,
         ratio_part_conjunta_min: float,
-        tasa_exito_min: float) -> pd.DataFrame:
+        tasa_exito_min: float,
+        n_permutaciones: int = 0,
+        alpha: float = 0.05) -> pd.DataFrame:
+    # con n_permutaciones > 0 solo cuentan las otras participantes cuya
+    # participación conjunta con la ganadora es significativa (p-valor <=
+    # alpha) frente al modelo nulo, ver pvalores_participacion_conjunta. En
+    # ese caso las participaciones también se cuentan por contrato distinto
+    # para que el numerador y el denominador del ratio sean comparables
     rs = 'razon_social_simple'
-    participantes = participantes.loc[:, ['numero_contrato', rs]].drop_duplicates()
-    cond = procedimientos.tipo_procedimiento != 'Adjudicación directa'
-    # FIXME: podemos usar los numero_contrato para sacar las
-    #  participaciones también. En lugar de solo usar razon social
-    ganadores = (procedimientos.loc[cond, [rs, 'numero_contrato']]
-                 .groupby(rs).numero_contrato.nunique()
-                 .reset_index()
-                 .rename(columns={'numero_contrato': 'contratos_ganados'}))
-    contratos_to_participantes = participantes.groupby('numero_contrato')[rs].unique()
-    # se genera una mapeo entre el número de contrato y la lista de sus participantes
-    contratos_to_participantes = contratos_to_participantes.map(
-        lambda arr: list(itertools.chain.from_iterable(e.split('/') for e in arr))
-    ).to_dict()
-    contratos_to_participantes = {
-        k: [e.strip() for e in v]
-        for k, v in contratos_to_participantes.items()
-    }
-    contratos_to_participantes = {
-        k: [e for e in v if e != '']
-        for k, v in contratos_to_participantes.items()
-    }
-    # se calcula la matriz de empresa a empresa con el numero
-    # de participaciones
-    conteos = {}
-    for g in ganadores[rs]:
-        conjuntos_participantes = []
-        for empresas in contratos_to_participantes.values():
-            if g in empresas:
-                conjuntos_participantes.append(empresas)
-        if len(conjuntos_participantes):
-            conteos[g] = Counter(
-                itertools.chain.from_iterable(conjuntos_participantes)
-            )
-    matriz = (pd.DataFrame.from_dict(conteos, orient='index')
-              .fillna(0).reset_index())
-    # dataframe: empresa_ganadora, empresa_participante, numero de participaciones
-    tidy = matriz.melt(
-        id_vars='index', var_name='empresa_participante', value_name='participaciones'
-    )
-    tidy = tidy.rename(columns={'index': 'empresa_ganadora'})
+    data = coparticipacion_ganadores(procedimientos, participantes,
+                                     repetidas=n_permutaciones == 0)
     # escogemos a las empresas con suficientes participaciones
-    empresas_selected = tidy.loc[tidy.empresa_ganadora == tidy.empresa_participante]
-    empresas_selected = empresas_selected.loc[
-        empresas_selected.participaciones >= participaciones_min,
-        'empresa_ganadora'
-    ]
-    empresas_selected = empresas_selected.to_numpy()
-    # Se filtran los registros con 0 participaciones. Además solo usamos
-    # los registros con las empresas seleccionadas
-    tidy = tidy.loc[tidy.empresa_ganadora.isin(empresas_selected)]
-    tidy = tidy.loc[tidy.participaciones > 0]
-    # se calcula la relación de participación conjunta entre la
-    # empresa ganadora y las otras participantes
-    empresas_sospechosas = []
-    for e in empresas_selected:
-        info_participaciones = tidy.loc[tidy.empresa_ganadora == e]
-        # numero participaciones de la empresa ganadora
-        total_participaciones = info_participaciones.loc[
-            info_participaciones.empresa_participante == e, 'participaciones'
-        ].values[0]
-        ratios_participacion_conjunta = info_participaciones.loc[
-            info_participaciones.empresa_participante != e,
-            'participaciones'
-        ].divide(total_participaciones)
-        if (ratios_participacion_conjunta >= ratio_part_conjunta_min).any():
-            record = {rs: e, 'participaciones': total_participaciones}
-            empresas_sospechosas.append(record)
-    df_empresas_sosp = pd.DataFrame(empresas_sospechosas)
-    df_empresas_sosp = pd.merge(df_empresas_sosp, ganadores, 'inner', on=rs)
-    ratio_exito = df_empresas_sosp.contratos_ganados.divide(
-        df_empresas_sosp.participaciones
-    )
-    cond_tasa = ratio_exito >= tasa_exito_min
-    df_empresas_sosp = df_empresas_sosp.loc[cond_tasa]
-    df_empresas_sosp = df_empresas_sosp.assign(
+    data = data.loc[data.participaciones >= participaciones_min]
+    max_participacion_conjunta = data.max_participacion_conjunta
+    if n_permutaciones > 0:
+        pares = pvalores_participacion_conjunta(
+            procedimientos, participantes, n_permutaciones
+        )
+        pares = pares.loc[pares.p_valor <= alpha]
+        significativa = pares.groupby('empresa_ganadora').participacion_conjunta.max()
+        max_participacion_conjunta = data[rs].map(significativa)
+    # relación de participación conjunta entre la empresa ganadora y la
+    # otra participante con la que más coincide
+    ratio = max_participacion_conjunta.divide(data.participaciones)
+    data = data.loc[ratio >= ratio_part_conjunta_min]
+    ratio_exito = data.contratos_ganados.divide(data.participaciones)
+    data = data.loc[ratio_exito >= tasa_exito_min]
+    df_empresas_sosp = data.loc[:, [rs]].assign(
         misma_competencia_y_tasa_exito_alta=1
     )
     feature = procedimientos.loc[:, [rs]].dropna().drop_duplicates()
@@ -469,3 +691,31 @@ def participacion_conjunta_sospechosa(
     feature_cols = [rs, 'misma_competencia_y_tasa_exito_alta']
     feature = feature.loc[:, feature_cols].fillna(0)
     return feature
+
+
+@lee_columnas('razon_social_simple', 'numero_contrato')
+def beneficiario_ofertas_cobertura(
+        procedimientos: pd.DataFrame,
+        ofertas: Union[pd.DataFrame, TablaOfertas],
+        participaciones_min: int = 5,
+        hhi_min: float = 0.5) -> pd.DataFrame:
+    # marca a las ganadoras que son el principal ganador de alguna empresa
+    # que participa seguido, nunca gana y casi siempre pierde contra las
+    # mismas ganadoras (ver colusion.cobertura_por_empresa). Los ganadores
+    # salen de tabla.es_ganador, por lo que si ofertas es una TablaOfertas
+    # debe haberse construido con procedimientos
+    rs = 'razon_social_simple'
+    tabla = tabla_ofertas(ofertas, procedimientos)
+    cobertura = cobertura_por_empresa(
+        tabla.contrato, tabla.empresa, tabla.es_ganador, tabla.empresas,
+        participaciones_min, hhi_min
+    )
+    beneficiario = pd.Series(
+        cobertura.beneficiario_ofertas_cobertura.to_numpy(),
+        index=cobertura.empresa.to_numpy()
+    )
+    feature = procedimientos.loc[:, [rs]].dropna().drop_duplicates()
+    feature = feature.assign(
+        beneficiario_ofertas_cobertura=feature[rs].map(beneficiario).fillna(0).astype(int)
+    )
+    return feature.reset_index(drop=True)
@@ -0,0 +1,199 @@
+"""Detección de posible fraccionamiento de contratos en adjudicaciones
+directas: varias adjudicaciones a la misma empresa, de la misma empresa
+productiva y materia, con descripciones parecidas y dentro de una ventana
+corta de días, cuya suma rebasa el monto que normalmente se adjudica.
+
+Todo se calcula sobre un solo arreglo ordenado por (grupo, fecha):
+
+- la similitud de descripciones se aproxima con MinHash de shingles de
+  palabras (hash de cada shingle con pd.util.hash_array), comparando cada
+  contrato con el anterior de su grupo. Un grupo se corta donde dos
+  contratos seguidos no se parecen, por lo que una sola adjudicación con
+  otra descripción en medio de una serie la parte en dos aunque las
+  demás se parezcan entre sí; no se compara contra toda la ventana
+- la ventana de días se resuelve con dos apuntadores (searchsorted sobre la
+  llave grupo-día) y la suma de montos con la suma acumulada
+- todas las adjudicaciones de una ventana que rebasa el umbral se marcan
+  con un arreglo de diferencias (+1 al inicio, -1 después del final) y su
+  suma acumulada
+
+por lo que el costo es O(n log n) por el ordenamiento."""
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+# primo de Mersenne 2**31 - 1 para las permutaciones de MinHash
+_PRIMO = np.int64(2 ** 31 - 1)
+
+
+def shingles(textos: pd.Series, k: int = 2) -> pd.DataFrame:
+    """Tabla (documento, hash) con el hash de cada shingle de k palabras
+    de cada texto. Los textos con menos de k palabras usan un solo shingle
+    con todas sus palabras. documento es la posición en textos"""
+    palabras = (textos.fillna('').str.lower()
+                .str.replace(r'[^\w]+', ' ', regex=True).str.split())
+    palabras = palabras.explode().dropna()
+    documento = palabras.index.to_numpy()
+    palabras = palabras.to_numpy(dtype=object)
+    if documento.shape[0] == 0:
+        return pd.DataFrame({'documento': documento, 'hash': np.zeros(0, np.uint64)})
+    # los shingles se forman con la palabra y las k - 1 siguientes del
+    # mismo documento
+    n = palabras.shape[0]
+    shingle = palabras.copy()
+    completo = np.ones(n, dtype=bool)
+    for j in range(1, k):
+        faltan = min(j, n)
+        siguiente = np.r_[palabras[j:], [''] * faltan]
+        mismo = np.r_[documento[j:] == documento[:max(n - j, 0)], np.zeros(faltan, dtype=bool)]
+        shingle = np.where(mismo, shingle + ' ' + siguiente, shingle)
+        completo &= mismo
+    # documentos sin ningún shingle completo: se usa el texto completo
+    primero = np.r_[True, documento[1:] != documento[:-1]]
+    con_completo = pd.Series(completo).groupby(documento).transform('any').to_numpy()
+    usar = completo | (primero & ~con_completo)
+    return pd.DataFrame({
+        'documento': documento[usar],
+        'hash': pd.util.hash_array(shingle[usar].astype(str)),
+    })
+
+
+def firmas_minhash(textos: pd.Series,
+                   n_hashes: int = 64,
+                   k: int = 2,
+                   semilla: int = 0) -> np.ndarray:
+    """Firma MinHash (len(textos) x n_hashes) de cada texto. Las firmas de
+    textos vacíos son -1"""
+    tabla = shingles(textos.reset_index(drop=True), k)
+    firmas = np.full((textos.shape[0], n_hashes), -1, dtype=np.int64)
+    if tabla.shape[0] == 0:
+        return firmas
+    rng = np.random.default_rng(semilla)
+    a = rng.integers(1, _PRIMO, n_hashes, dtype=np.int64)
+    b = rng.integers(0, _PRIMO, n_hashes, dtype=np.int64)
+    tabla = tabla.sort_values('documento', kind='mergesort')
+    documento = tabla.documento.to_numpy()
+    h = (tabla.hash.to_numpy() % np.uint64(_PRIMO)).astype(np.int64)
+    permutados = (h[:, None] * a + b) % _PRIMO
+    inicio = np.flatnonzero(np.r_[True, documento[1:] != documento[:-1]])
+    firmas[documento[inicio]] = np.minimum.reduceat(permutados, inicio, axis=0)
+    return firmas
+
+
+def similitud_consecutiva(firmas: np.ndarray) -> np.ndarray:
+    """Similitud de Jaccard estimada entre cada firma y la anterior. Es
+    nula para la primera y cuando alguna de las dos es de un texto vacío"""
+    similitud = np.full(firmas.shape[0], np.nan)
+    if firmas.shape[0] < 2:
+        return similitud
+    iguales = (firmas[1:] == firmas[:-1]).mean(axis=1)
+    vacio = (firmas[:, 0] < 0)
+    similitud[1:] = np.where(vacio[1:] | vacio[:-1], np.nan, iguales)
+    return similitud
+
+
+def ventanas_montos(grupo: np.ndarray,
+                    dias: np.ndarray,
+                    montos: np.ndarray,
+                    ventana: int) -> pd.DataFrame:
+    """Para datos ordenados por (grupo, dias) regresa, para cada renglón,
+    el número de renglones y la suma de montos de su grupo en los
+    ventana días anteriores (incluyéndolo)"""
+    dias = dias - dias.min() if dias.shape[0] else dias
+    escala = int(dias.max()) + ventana + 1 if dias.shape[0] else 1
+    llave = grupo.astype(np.int64) * escala + dias
+    izquierda = np.searchsorted(llave, llave - ventana, side='left')
+    acumulado = np.r_[0, np.cumsum(montos)]
+    posicion = np.arange(llave.shape[0])
+    return pd.DataFrame({
+        'contratos_en_ventana': posicion + 1 - izquierda,
+        'monto_en_ventana': acumulado[posicion + 1] - acumulado[izquierda],
+    })
+
+
+def fraccionamiento(adjudicaciones: pd.DataFrame,
+                    llaves: list,
+                    fecha_col: str,
+                    ventana: int = 30,
+                    umbral: Optional[pd.Series] = None,
+                    descripcion_col: Optional[str] = None,
+                    similitud_min: float = 0.5,
+                    n_hashes: int = 64,
+                    llaves_umbral: Optional[list] = None,
+                    cuantil_umbral: float = 0.9) -> pd.DataFrame:
+    """Marca las adjudicaciones que forman parte de una posible división.
+
+    Parameters
+    ----------
+    adjudicaciones: pd.DataFrame
+        Una adjudicación por renglón con llaves, fecha_col y monto, sin
+        nulos en esas columnas
+    llaves: list
+        Columnas que definen al grupo, por ejemplo razón social, empresa
+        productiva y materia
+    ventana: int
+        Días de la ventana
+    umbral: pd.Series, opcional
+        Monto de referencia de cada renglón. Una ventana es sospechosa si
+        el monto de su última adjudicación es menor al umbral pero la suma
+        de la ventana lo rebasa, y se marcan todas sus adjudicaciones. Por
+        default es el cuantil cuantil_umbral de los montos de su grupo de
+        llaves_umbral (de todas las adjudicaciones si no se indica)
+    descripcion_col: str, opcional
+        Si se indica, el grupo se corta entre dos adjudicaciones seguidas
+        con similitud de descripción menor a similitud_min. Sin ella los
+        grupos son solo los de llaves
+    llaves_umbral: list, opcional
+        Columnas con las que se calcula el umbral por default, por ejemplo
+        empresa productiva y materia
+
+    Returns
+    -------
+    adjudicaciones con contratos_en_ventana, monto_en_ventana,
+    similitud_descripcion y posible_fraccionamiento, en el orden original
+    """
+    if umbral is None:
+        if llaves_umbral is None:
+            umbral = pd.Series(adjudicaciones.monto.quantile(cuantil_umbral),
+                               index=adjudicaciones.index)
+        else:
+            umbral = (adjudicaciones.groupby(llaves_umbral)
+                      .monto.transform('quantile', cuantil_umbral))
+    data = adjudicaciones.assign(_posicion=np.arange(adjudicaciones.shape[0]))
+    data = data.sort_values(llaves + [fecha_col], kind='mergesort')
+    grupo = data.groupby(llaves, sort=False).ngroup().to_numpy()
+    nuevo = np.r_[True, grupo[1:] != grupo[:-1]]
+    similitud = np.full(data.shape[0], np.nan)
+    if descripcion_col is not None:
+        similitud = similitud_consecutiva(
+            firmas_minhash(data[descripcion_col], n_hashes)
+        )
+        # la primera adjudicación de cada grupo no se compara con la
+        # última del grupo anterior
+        similitud[nuevo] = np.nan
+        nuevo |= similitud < similitud_min
+    grupo = np.cumsum(nuevo)
+    dias = data[fecha_col].to_numpy().astype('datetime64[D]').astype(np.int64)
+    ventanas = ventanas_montos(grupo, dias, data.monto.to_numpy(dtype=float), ventana)
+    umbral = umbral.to_numpy()[data._posicion.to_numpy()]
+    contratos_en_ventana = ventanas.contratos_en_ventana.to_numpy()
+    cruza = ((contratos_en_ventana > 1)
+             & (data.monto.to_numpy() < umbral)
+             & (ventanas.monto_en_ventana.to_numpy() >= umbral))
+    # se marcan las adjudicaciones de [inicio, fin] de cada ventana que
+    # cruza el umbral, no solo la que lo rebasa
+    fin = np.flatnonzero(cruza)
+    inicio = fin + 1 - contratos_en_ventana[fin]
+    diferencias = np.zeros(data.shape[0] + 1, dtype=np.int64)
+    np.add.at(diferencias, inicio, 1)
+    np.add.at(diferencias, fin + 1, -1)
+    sospechoso = np.cumsum(diferencias[:-1]) > 0
+    resultado = np.empty(data.shape[0], dtype=np.int64)
+    resultado[data._posicion.to_numpy()] = np.arange(data.shape[0])
+    adjudicaciones = adjudicaciones.assign(
+        contratos_en_ventana=contratos_en_ventana[resultado],
+        monto_en_ventana=ventanas.monto_en_ventana.to_numpy()[resultado],
+        similitud_descripcion=similitud[resultado],
+        posible_fraccionamiento=sospechoso.astype(int)[resultado],
+    )
+    return adjudicaciones
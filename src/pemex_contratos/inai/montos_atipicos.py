@@ -0,0 +1,192 @@
+"""Montos atípicos por (materia, empresa_productiva, año).
+
+El z-score robusto de un contrato es 0.6745 (log(monto) - mediana) / MAD,
+con la mediana y la MAD (mediana de las desviaciones absolutas) del log
+del monto de su grupo. Un contrato es atípico si |z| > 3.5 (Iglewicz y
+Hoaglin).
+
+Para calificar contratos nuevos sin recalcular todo se guarda la historia
+de cada grupo como arreglos ordenados (CSR: indptr y valores). La mediana
+de un grupo es el elemento central de su arreglo y la MAD se obtiene por
+bisección sobre la distancia d, contando con dos searchsorted cuántos
+valores caen en [mediana - d, mediana + d], por lo que cada contrato nuevo
+cuesta O(log n) búsquedas."""
+import numpy as np
+import pandas as pd
+from typing import NamedTuple, Optional
+
+LLAVES_MONTO = ['materia', 'empresa_productiva', 'anio']
+
+# constante para que la MAD sea comparable con la desviación estándar
+_CONSTANTE_MAD = 0.6745
+
+
+class HistoriaMontos(NamedTuple):
+    materia: np.ndarray             # llaves de cada grupo
+    empresa_productiva: np.ndarray
+    anio: np.ndarray
+    indptr: np.ndarray              # valores del grupo i: indptr[i]:indptr[i + 1]
+    valores: np.ndarray             # log(monto), ordenados dentro de cada grupo
+
+
+def montos_por_contrato(procedimientos: pd.DataFrame,
+                        fecha_col: str = 'fecha_del_contrato') -> pd.DataFrame:
+    """Un renglón por (num_evento, numero_contrato) con materia,
+    empresa_productiva, anio y log_monto (suma de los montos de sus
+    renglones). Se quitan los contratos sin monto positivo o sin llaves"""
+    cols = ['num_evento', 'numero_contrato', 'materia', 'empresa_productiva',
+            'monto', fecha_col]
+    contratos = (procedimientos.loc[:, cols]
+                 .groupby(['num_evento', 'numero_contrato'], as_index=False)
+                 .agg({'materia': 'first', 'empresa_productiva': 'first',
+                       'monto': 'sum', fecha_col: 'min'}))
+    contratos = contratos.assign(anio=contratos[fecha_col].dt.year)
+    contratos = contratos.loc[contratos.monto > 0].dropna(subset=LLAVES_MONTO)
+    contratos = contratos.assign(
+        anio=contratos.anio.astype(int),
+        log_monto=np.log(contratos.monto),
+    )
+    return contratos.drop(columns=[fecha_col]).reset_index(drop=True)
+
+
+def monto_atipico(procedimientos: pd.DataFrame,
+                  fecha_col: str = 'fecha_del_contrato',
+                  z_max: float = 3.5) -> pd.DataFrame:
+    """z_monto_robusto y monto_atipico de cada contrato contra su grupo
+    (materia, empresa_productiva, año). Se calcula con dos
+    transform('median') sobre el log del monto. Los grupos con MAD cero
+    tienen z nulo"""
+    contratos = montos_por_contrato(procedimientos, fecha_col)
+    grupos = contratos.groupby(LLAVES_MONTO).log_monto
+    mediana = grupos.transform('median')
+    desviacion = (contratos.log_monto - mediana).abs()
+    mad = desviacion.groupby([contratos[c] for c in LLAVES_MONTO]).transform('median')
+    z = _CONSTANTE_MAD * (contratos.log_monto - mediana) / mad.where(mad > 0)
+    feature = contratos.loc[:, ['num_evento', 'numero_contrato']].assign(
+        z_monto_robusto=z,
+        monto_atipico=(z.abs() > z_max).astype(int).where(~z.isna()),
+    )
+    return feature
+
+
+def construir_historia(procedimientos: pd.DataFrame,
+                       fecha_col: str = 'fecha_del_contrato',
+                       historia: Optional[HistoriaMontos] = None) -> HistoriaMontos:
+    """Crea la historia de montos o le agrega los contratos de
+    procedimientos. Los grupos quedan ordenados por sus llaves"""
+    contratos = montos_por_contrato(procedimientos, fecha_col)
+    contratos = contratos.loc[:, LLAVES_MONTO + ['log_monto']]
+    if historia is not None:
+        tamanos = np.diff(historia.indptr)
+        anterior = pd.DataFrame({
+            'materia': np.repeat(historia.materia, tamanos),
+            'empresa_productiva': np.repeat(historia.empresa_productiva, tamanos),
+            'anio': np.repeat(historia.anio, tamanos),
+            'log_monto': historia.valores,
+        })
+        contratos = pd.concat([anterior, contratos], axis=0, ignore_index=True)
+    contratos = contratos.sort_values(LLAVES_MONTO + ['log_monto'], kind='mergesort')
+    grupos = contratos.groupby(LLAVES_MONTO, sort=False).size().reset_index(name='n')
+    indptr = np.zeros(grupos.shape[0] + 1, dtype=np.int64)
+    np.cumsum(grupos.n.to_numpy(), out=indptr[1:])
+    return HistoriaMontos(
+        materia=np.asarray(grupos.materia, dtype=str),
+        empresa_productiva=np.asarray(grupos.empresa_productiva, dtype=str),
+        anio=grupos.anio.to_numpy(dtype=np.int64),
+        indptr=indptr,
+        valores=contratos.log_monto.to_numpy(dtype=float),
+    )
+
+
+def guardar_historia(historia: HistoriaMontos, path: str):
+    np.savez(path, **historia._asdict())
+
+
+def cargar_historia(path: str) -> HistoriaMontos:
+    with np.load(path) as arreglos:
+        return HistoriaMontos(**{c: arreglos[c] for c in HistoriaMontos._fields})
+
+
+def _mediana_ordenada(valores: np.ndarray,
+                      inicio: np.ndarray,
+                      n: np.ndarray) -> np.ndarray:
+    """Mediana de los segmentos ordenados valores[inicio:inicio + n]"""
+    bajo = valores[inicio + (n - 1) // 2]
+    alto = valores[inicio + n // 2]
+    return (bajo + alto) / 2
+
+
+def mediana_y_mad_historia(historia: HistoriaMontos,
+                           grupo: np.ndarray,
+                           iteraciones: int = 60) -> pd.DataFrame:
+    """Mediana y MAD de los grupos indicados (posiciones en la historia)
+    con búsquedas binarias sobre sus arreglos ordenados.
+
+    La k-ésima desviación absoluta más chica es la menor distancia d tal
+    que al menos k valores del grupo están en [mediana - d, mediana + d],
+    y se encuentra por bisección sobre d; al final se toma la distancia
+    exacta al valor del grupo que la alcanza. La MAD es el promedio de las dos
+    desviaciones centrales, igual que la mediana de pandas. Como las llaves
+    de búsqueda deben ser crecientes en todo el arreglo, cada valor se
+    desplaza por su número de grupo por el rango total de los valores"""
+    if grupo.shape[0] == 0:
+        return pd.DataFrame({'mediana': [], 'mad': [], 'n_historia': []})
+    inicio = historia.indptr[grupo]
+    n = historia.indptr[grupo + 1] - inicio
+    valores = historia.valores
+    mediana = _mediana_ordenada(valores, inicio, n)
+    minimo = valores.min()
+    rango = valores.max() - minimo + 1
+    grupo_valor = np.repeat(np.arange(historia.indptr.shape[0] - 1), np.diff(historia.indptr))
+    llaves = valores - minimo + grupo_valor * rango
+    centro = mediana - minimo + grupo * rango
+    # bisección vectorizada para las dos desviaciones centrales de todos
+    # los grupos a la vez
+    k = np.concatenate([(n + 1) // 2, n // 2 + 1])
+    centro = np.concatenate([centro, centro])
+    bajo = np.zeros(k.shape[0])
+    alto = np.full(k.shape[0], rango)
+    for _ in range(iteraciones):
+        d = (bajo + alto) / 2
+        dentro = (np.searchsorted(llaves, centro + d, side='right')
+                  - np.searchsorted(llaves, centro - d, side='left'))
+        suficiente = dentro >= k
+        alto = np.where(suficiente, d, alto)
+        bajo = np.where(suficiente, bajo, d)
+    # alto queda apenas arriba de la desviación buscada (nunca llega a
+    # cero); se reemplaza por la distancia real al valor más lejano dentro
+    # de [mediana - alto, mediana + alto], que es cero si la MAD es cero
+    derecha = np.searchsorted(llaves, centro + alto, side='right') - 1
+    izquierda = np.searchsorted(llaves, centro - alto, side='left')
+    alto = np.maximum(np.maximum(llaves[derecha] - centro, centro - llaves[izquierda]), 0)
+    mad = (alto[:grupo.shape[0]] + alto[grupo.shape[0]:]) / 2
+    return pd.DataFrame({'mediana': mediana, 'mad': mad, 'n_historia': n})
+
+
+def monto_atipico_historia(procedimientos: pd.DataFrame,
+                           historia: HistoriaMontos,
+                           fecha_col: str = 'fecha_del_contrato',
+                           z_max: float = 3.5) -> pd.DataFrame:
+    """Califica contratos nuevos contra la historia de su grupo sin
+    agregarlos a ella (ver construir_historia para actualizarla). Los
+    contratos de grupos sin historia o con MAD cero tienen z nulo"""
+    contratos = montos_por_contrato(procedimientos, fecha_col)
+    indice = pd.MultiIndex.from_arrays(
+        [historia.materia, historia.empresa_productiva, historia.anio]
+    )
+    llaves = contratos.loc[:, LLAVES_MONTO].astype({'materia': str, 'empresa_productiva': str})
+    grupo = indice.get_indexer(pd.MultiIndex.from_frame(llaves))
+    con_historia = grupo >= 0
+    estadisticas = mediana_y_mad_historia(historia, grupo[con_historia])
+    mediana = np.full(contratos.shape[0], np.nan)
+    mad = np.full(contratos.shape[0], np.nan)
+    mediana[con_historia] = estadisticas.mediana.to_numpy()
+    mad[con_historia] = estadisticas.mad.to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = _CONSTANTE_MAD * (contratos.log_monto.to_numpy() - mediana) / mad
+    z = pd.Series(np.where(mad > 0, z, np.nan))
+    feature = contratos.loc[:, ['num_evento', 'numero_contrato']].assign(
+        z_monto_robusto=z,
+        monto_atipico=(z.abs() > z_max).astype(int).where(~z.isna()),
+    )
+    return feature
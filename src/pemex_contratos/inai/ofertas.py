@@ -0,0 +1,122 @@
+"""Tabla de hechos de ofertas compartida por los features de proveedor.
+
+La tabla de ofertas se normaliza una sola vez: se quitan los repetidos, los
+consorcios ('A / B') se separan en sus empresas y se quitan los nombres
+vacíos. El resultado se guarda como arreglos de códigos enteros (contrato,
+empresa) más las marcas es_ganador y consorcio, y se puede guardar en disco
+con una llave que depende del contenido de las ofertas y de los ganadores,
+de modo que solo se recalcula cuando cambian las entradas."""
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+
+class TablaOfertas(NamedTuple):
+    contratos: np.ndarray   # numero_contrato de cada código, con su tipo original
+    empresas: np.ndarray    # razon_social_simple de cada código, ordenadas
+    contrato: np.ndarray    # código de contrato de cada participación
+    empresa: np.ndarray     # código de empresa de cada participación
+    es_ganador: np.ndarray  # la empresa ganó ese contrato
+    consorcio: np.ndarray   # la participación fue como parte de un consorcio
+
+
+def separar_consorcios(ofertas: pd.DataFrame) -> pd.DataFrame:
+    """Tabla (numero_contrato, razon_social_simple, consorcio) con un
+    renglón por empresa participante. Se conserva cada aparición, por lo
+    que una empresa puede aparecer más de una vez en el mismo contrato"""
+    rs = 'razon_social_simple'
+    ofertas = (ofertas.loc[:, ['numero_contrato', rs]]
+               .dropna().drop_duplicates().reset_index(drop=True))
+    empresas = ofertas[rs].str.split('/').explode().str.strip()
+    posicion = empresas.index.to_numpy()
+    participantes = pd.DataFrame({
+        'numero_contrato': ofertas.numero_contrato.to_numpy()[posicion],
+        rs: empresas.to_numpy(),
+        'consorcio': np.bincount(posicion, minlength=ofertas.shape[0])[posicion] > 1,
+    })
+    return participantes
+
+
+def clave_ofertas(ofertas: pd.DataFrame,
+                  procedimientos: Optional[pd.DataFrame] = None) -> str:
+    """Hash del contenido de las ofertas y de los ganadores de
+    procedimientos. No depende del índice"""
+    cols = ['numero_contrato', 'razon_social_simple']
+    llave = hashlib.sha1()
+    llave.update(pd.util.hash_pandas_object(ofertas.loc[:, cols], index=False)
+                 .to_numpy().tobytes())
+    if procedimientos is not None:
+        llave.update(pd.util.hash_pandas_object(procedimientos.loc[:, cols], index=False)
+                     .to_numpy().tobytes())
+    return llave.hexdigest()
+
+
+def construir_tabla_ofertas(ofertas: pd.DataFrame,
+                            procedimientos: Optional[pd.DataFrame] = None) -> TablaOfertas:
+    """Normaliza la tabla de ofertas. Si se indica procedimientos, una
+    participación es ganadora si (numero_contrato, razon_social_simple)
+    aparece en procedimientos (también separando consorcios)"""
+    rs = 'razon_social_simple'
+    participantes = separar_consorcios(ofertas)
+    participantes = participantes.loc[participantes[rs] != '']
+    codigos_contrato, contratos = pd.factorize(participantes.numero_contrato, sort=True)
+    codigos_empresa, empresas = pd.factorize(participantes[rs], sort=True)
+    es_ganador = np.zeros(participantes.shape[0], dtype=bool)
+    if procedimientos is not None:
+        ganadores = separar_consorcios(procedimientos)
+        ganadores = pd.MultiIndex.from_frame(ganadores.loc[:, ['numero_contrato', rs]])
+        llaves = pd.MultiIndex.from_frame(participantes.loc[:, ['numero_contrato', rs]])
+        es_ganador = llaves.isin(ganadores)
+    # se conserva el tipo de numero_contrato para que tabla_participantes
+    # regrese las mismas llaves que la tabla original; solo los de texto
+    # (object) se pasan a str para poder guardarlos con savez
+    contratos = np.asarray(contratos)
+    if contratos.dtype == object:
+        contratos = contratos.astype(str)
+    return TablaOfertas(
+        contratos=contratos,
+        empresas=np.asarray(empresas, dtype=str),
+        contrato=codigos_contrato.astype(np.int32),
+        empresa=codigos_empresa.astype(np.int32),
+        es_ganador=np.asarray(es_ganador, dtype=bool),
+        consorcio=participantes.consorcio.to_numpy(dtype=bool),
+    )
+
+
+def guardar_tabla_ofertas(tabla: TablaOfertas, path: str):
+    np.savez(path, **tabla._asdict())
+
+
+def cargar_tabla_ofertas(path: str) -> TablaOfertas:
+    with np.load(path) as arreglos:
+        return TablaOfertas(**{c: arreglos[c] for c in TablaOfertas._fields})
+
+
+def tabla_ofertas(ofertas: Union[pd.DataFrame, TablaOfertas],
+                  procedimientos: Optional[pd.DataFrame] = None,
+                  path_cache: Optional[str] = None) -> TablaOfertas:
+    """Regresa la tabla de hechos de ofertas. Si ofertas ya es una
+    TablaOfertas se regresa tal cual. Con path_cache (una carpeta) la tabla
+    se lee de ahí si ya se calculó para las mismas entradas y si no se
+    calcula y se guarda"""
+    if isinstance(ofertas, TablaOfertas):
+        return ofertas
+    if path_cache is None:
+        return construir_tabla_ofertas(ofertas, procedimientos)
+    path = Path(path_cache) / f'ofertas_{clave_ofertas(ofertas, procedimientos)}.npz'
+    if path.exists():
+        return cargar_tabla_ofertas(str(path))
+    tabla = construir_tabla_ofertas(ofertas, procedimientos)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    guardar_tabla_ofertas(tabla, str(path))
+    return tabla
+
+
+def tabla_participantes(tabla: TablaOfertas) -> pd.DataFrame:
+    """Tabla (numero_contrato, razon_social_simple) de las participaciones"""
+    return pd.DataFrame({
+        'numero_contrato': tabla.contratos[tabla.contrato],
+        'razon_social_simple': tabla.empresas[tabla.empresa],
+    })
@@ -0,0 +1,162 @@
+"""Modelo nulo por permutaciones para la participación conjunta.
+
+Se parte de la tabla de incidencia (empresa, contrato) sin repetidos y
+las réplicas salen de una cadena curveball global (Carstens et al.): en
+cada intercambio las empresas se juntan en parejas al azar y cada pareja
+revuelve entre sí los contratos en los que participa solo una de las dos.
+Cada empresa conserva exactamente su número de participaciones y cada
+contrato su número de participantes, sin repetir una empresa en un
+contrato. Entre réplicas se hacen varios intercambios globales.
+
+El p-valor empírico de un par es (1 + réplicas con conteo >= observado) /
+(1 + réplicas)."""
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from typing import Optional, Tuple
+
+
+def matriz_incidencia(codigos_empresa: np.ndarray,
+                      codigos_contrato: np.ndarray,
+                      forma: Tuple[int, int]) -> sparse.csr_matrix:
+    """Matriz binaria empresa x contrato"""
+    incidencia = sparse.csr_matrix(
+        (np.ones(codigos_empresa.shape[0], dtype=np.int32),
+         (codigos_empresa, codigos_contrato)),
+        shape=forma
+    )
+    incidencia.data[:] = 1
+    return incidencia
+
+
+def curveball_global(codigos_empresa: np.ndarray,
+                     codigos_contrato: np.ndarray,
+                     n_empresas: int,
+                     n_contratos: int,
+                     rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """Un intercambio curveball global sobre los pares (empresa, contrato)
+    sin repetidos. Regresa los nuevos pares con las mismas sumas por
+    empresa y por contrato.
+
+    Las empresas se juntan en parejas con una permutación. Los contratos de
+    una pareja en los que participan las dos se quedan; los demás se
+    ordenan al azar dentro de la pareja y se reparten de nuevo, cada
+    empresa recibe tantos como tenía. Todas las parejas se resuelven a la
+    vez con dos lexsort"""
+    pareja = np.empty(n_empresas, dtype=np.int64)
+    pareja[rng.permutation(n_empresas)] = np.arange(n_empresas) // 2
+    par = pareja[codigos_empresa]
+    _, inverso, conteo = np.unique(par * n_contratos + codigos_contrato,
+                                   return_inverse=True, return_counts=True)
+    compartido = conteo[inverso] > 1
+    empresa_libre = codigos_empresa[~compartido]
+    contrato_libre = codigos_contrato[~compartido]
+    par_libre = par[~compartido]
+    # ordenadas por (pareja, empresa), las empresas quedan en bloques del
+    # tamaño de sus contratos libres; los contratos van en orden aleatorio
+    # dentro de cada pareja
+    empresa_libre = empresa_libre[np.lexsort((empresa_libre, par_libre))]
+    contrato_libre = contrato_libre[np.lexsort((rng.random(par_libre.shape[0]), par_libre))]
+    return (np.concatenate([codigos_empresa[compartido], empresa_libre]),
+            np.concatenate([codigos_contrato[compartido], contrato_libre]))
+
+
+def pares_coparticipacion(incidencia: sparse.csr_matrix,
+                          filas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Conteo de contratos en común entre cada empresa de filas y las demás
+    empresas. Los pares se identifican con la llave
+    empresa * n_empresas + otra_empresa"""
+    conjunta = (incidencia[filas] @ incidencia.T).tocoo()
+    empresa = filas[conjunta.row]
+    otra = conjunta.col
+    distintas = empresa != otra
+    llaves = empresa[distintas].astype(np.int64) * incidencia.shape[0] + otra[distintas]
+    return llaves, conjunta.data[distintas]
+
+
+def _excedencias(codigos_empresa: np.ndarray,
+                 codigos_contrato: np.ndarray,
+                 forma: Tuple[int, int],
+                 filas: np.ndarray,
+                 llaves: np.ndarray,
+                 observados: np.ndarray,
+                 n_permutaciones: int,
+                 semilla: np.random.SeedSequence,
+                 intercambios: int) -> np.ndarray:
+    """Número de réplicas en las que cada par iguala o supera su conteo
+    observado. Cada lote corre su propia cadena desde la tabla observada"""
+    rng = np.random.default_rng(semilla)
+    excedencias = np.zeros(llaves.shape[0], dtype=np.int64)
+    empresa, contrato = codigos_empresa, codigos_contrato
+    for _ in range(n_permutaciones):
+        for _ in range(intercambios):
+            empresa, contrato = curveball_global(empresa, contrato, *forma, rng)
+        incidencia = matriz_incidencia(empresa, contrato, forma)
+        llaves_nulas, conteos_nulos = pares_coparticipacion(incidencia, filas)
+        posicion = np.searchsorted(llaves, llaves_nulas)
+        posicion = np.minimum(posicion, llaves.shape[0] - 1)
+        # los pares que no se observaron no se evalúan
+        observado = llaves[posicion] == llaves_nulas
+        posicion = posicion[observado]
+        excedencias[posicion] += conteos_nulos[observado] >= observados[posicion]
+    return excedencias
+
+
+def pvalores_coparticipacion(codigos_empresa: np.ndarray,
+                             codigos_contrato: np.ndarray,
+                             n_empresas: int,
+                             n_contratos: int,
+                             filas: Optional[np.ndarray] = None,
+                             n_permutaciones: int = 1000,
+                             n_jobs: int = -1,
+                             semilla: int = 0,
+                             intercambios: int = 10) -> pd.DataFrame:
+    """P-valores empíricos de la participación conjunta observada.
+
+    Parameters
+    ----------
+    codigos_empresa, codigos_contrato: np.ndarray
+        Pares (empresa, contrato) sin repetidos, como códigos enteros
+    filas: np.ndarray, opcional
+        Códigos de las empresas cuyos pares se evalúan (por ejemplo las
+        ganadoras). Si no se indica se evalúan todas
+    n_permutaciones: int
+        Réplicas del modelo nulo. Se reparten en lotes entre procesos, cada
+        uno con su propia semilla
+    intercambios: int
+        Intercambios curveball globales antes de cada réplica
+
+    Returns
+    -------
+    Tabla con empresa, otra_empresa (códigos), participacion_conjunta
+    observada y p_valor
+    """
+    forma = (n_empresas, n_contratos)
+    if filas is None:
+        filas = np.arange(n_empresas)
+    filas = np.asarray(filas)
+    incidencia = matriz_incidencia(codigos_empresa, codigos_contrato, forma)
+    llaves, observados = pares_coparticipacion(incidencia, filas)
+    orden = np.argsort(llaves)
+    llaves, observados = llaves[orden], observados[orden]
+    excedencias = np.zeros(llaves.shape[0], dtype=np.int64)
+    if llaves.shape[0] and n_permutaciones > 0:
+        n_lotes = min(joblib.effective_n_jobs(n_jobs), n_permutaciones)
+        lotes = [lote.shape[0] for lote in np.array_split(np.arange(n_permutaciones), n_lotes)]
+        semillas = np.random.SeedSequence(semilla).spawn(n_lotes)
+        resultados = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(_excedencias)(
+                codigos_empresa, codigos_contrato, forma, filas,
+                llaves, observados, n, semilla_lote, intercambios
+            )
+            for n, semilla_lote in zip(lotes, semillas)
+        )
+        excedencias = np.sum(resultados, axis=0)
+    pares = pd.DataFrame({
+        'empresa': llaves // n_empresas,
+        'otra_empresa': llaves % n_empresas,
+        'participacion_conjunta': observados,
+        'p_valor': (1 + excedencias) / (1 + n_permutaciones),
+    })
+    return pares
@@ -0,0 +1,232 @@
+"""Red de participación conjunta entre proveedores.
+
+Dos empresas están conectadas si participaron en el mismo contrato (tabla
+de ofertas). Cada arista guarda el número de contratos en común y la
+primera y última fecha en la que coincidieron. La red se guarda en
+arreglos CSR (indptr, indices, datos) simétricos, con los nodos ordenados
+alfabéticamente, para consultarla sin volver a procesar las ofertas."""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from typing import List, NamedTuple, Optional, Union
+from .features_proveedor import participantes_por_contrato
+from .ofertas import TablaOfertas
+
+
+class RedCoparticipacion(NamedTuple):
+    nodos: np.ndarray      # razon_social_simple, ordenadas
+    indptr: np.ndarray
+    indices: np.ndarray
+    conteos: np.ndarray    # contratos en común
+    primera: np.ndarray    # datetime64[D], NaT si no hay fechas
+    ultima: np.ndarray     # datetime64[D]
+    contratos: np.ndarray  # numero_contrato ya incluidos en la red
+
+
+def fechas_contratos(procedimientos: pd.DataFrame,
+                     fecha_col: str = 'fecha_convocatoria') -> pd.Series:
+    """Fecha de cada numero_contrato para fechar las aristas"""
+    return procedimientos.groupby('numero_contrato')[fecha_col].min()
+
+
+def aristas_ofertas(ofertas: Union[pd.DataFrame, TablaOfertas],
+                    fechas: Optional[pd.Series] = None) -> pd.DataFrame:
+    """Lista de aristas (empresa_a < empresa_b) con conteo, primera y
+    ultima fecha a partir de la tabla de ofertas"""
+    rs = 'razon_social_simple'
+    participantes = participantes_por_contrato(ofertas)
+    participantes = (participantes.loc[participantes[rs] != '']
+                     .drop_duplicates())
+    fecha = pd.Series(pd.NaT, index=participantes.index, dtype='datetime64[ns]')
+    if fechas is not None:
+        fecha = pd.to_datetime(
+            participantes.numero_contrato.map(fechas)
+        ).astype('datetime64[ns]')
+    participantes = participantes.assign(fecha=fecha)
+    pares = pd.merge(participantes, participantes.loc[:, ['numero_contrato', rs]],
+                     on='numero_contrato', suffixes=('_a', '_b'))
+    pares = pares.loc[pares[f'{rs}_a'] < pares[f'{rs}_b']]
+    aristas = (pares.groupby([f'{rs}_a', f'{rs}_b'])
+               .agg(conteo=('numero_contrato', 'size'),
+                    primera=('fecha', 'min'),
+                    ultima=('fecha', 'max'))
+               .reset_index()
+               .rename(columns={f'{rs}_a': 'empresa_a', f'{rs}_b': 'empresa_b'}))
+    return aristas
+
+
+def _desde_aristas(aristas: pd.DataFrame,
+                   nodos: np.ndarray,
+                   contratos: np.ndarray) -> RedCoparticipacion:
+    nodos = np.unique(np.concatenate([
+        np.asarray(nodos, dtype=str),
+        aristas.empresa_a.to_numpy(dtype=str),
+        aristas.empresa_b.to_numpy(dtype=str),
+    ]))
+    a = np.searchsorted(nodos, aristas.empresa_a.to_numpy(dtype=str))
+    b = np.searchsorted(nodos, aristas.empresa_b.to_numpy(dtype=str))
+    # aristas en ambos sentidos, ordenadas por renglón y columna
+    renglon = np.concatenate([a, b])
+    columna = np.concatenate([b, a])
+    orden = np.lexsort((columna, renglon))
+
+    def valores(columna_aristas, dtype):
+        x = aristas[columna_aristas].to_numpy(dtype=dtype)
+        return np.concatenate([x, x])[orden]
+
+    indptr = np.zeros(nodos.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(renglon, minlength=nodos.shape[0]), out=indptr[1:])
+    return RedCoparticipacion(
+        nodos=nodos,
+        indptr=indptr,
+        indices=columna[orden].astype(np.int32),
+        conteos=valores('conteo', np.int32),
+        primera=valores('primera', 'datetime64[ns]').astype('datetime64[D]'),
+        ultima=valores('ultima', 'datetime64[ns]').astype('datetime64[D]'),
+        contratos=np.unique(np.asarray(contratos, dtype=str)),
+    )
+
+
+def _a_aristas(red: RedCoparticipacion) -> pd.DataFrame:
+    renglon = np.repeat(np.arange(red.nodos.shape[0]), np.diff(red.indptr))
+    arriba = renglon < red.indices
+    return pd.DataFrame({
+        'empresa_a': red.nodos[renglon[arriba]],
+        'empresa_b': red.nodos[red.indices[arriba]],
+        'conteo': red.conteos[arriba],
+        'primera': red.primera[arriba].astype('datetime64[ns]'),
+        'ultima': red.ultima[arriba].astype('datetime64[ns]'),
+    })
+
+
+def construir_red(ofertas: Union[pd.DataFrame, TablaOfertas],
+                  fechas: Optional[pd.Series] = None) -> RedCoparticipacion:
+    """Construye la red de participación conjunta de la tabla de ofertas.
+
+    Parameters
+    ----------
+    ofertas: pd.DataFrame o TablaOfertas
+        Tabla con numero_contrato y razon_social_simple (la misma que
+        recibe features_proveedor) o su tabla de hechos normalizada
+    fechas: pd.Series, opcional
+        Fecha de cada numero_contrato, ver fechas_contratos
+    """
+    aristas = aristas_ofertas(ofertas, fechas)
+    if isinstance(ofertas, TablaOfertas):
+        return _desde_aristas(aristas, ofertas.empresas, ofertas.contratos)
+    empresas = participantes_por_contrato(ofertas).razon_social_simple
+    empresas = empresas.loc[empresas != ''].unique()
+    contratos = ofertas.numero_contrato.dropna().unique()
+    return _desde_aristas(aristas, empresas, contratos)
+
+
+def actualizar_red(red: RedCoparticipacion,
+                   ofertas: pd.DataFrame,
+                   fechas: Optional[pd.Series] = None) -> RedCoparticipacion:
+    """Agrega a la red solo los contratos de ofertas que no contiene. Las
+    ofertas de un contrato nuevo deben llegar completas en la misma
+    actualización"""
+    nuevas = ofertas.loc[~ofertas.numero_contrato.astype(str).isin(red.contratos)]
+    if nuevas.shape[0] == 0:
+        return red
+    nueva_red = construir_red(nuevas, fechas)
+    aristas = pd.concat([_a_aristas(red), _a_aristas(nueva_red)],
+                        axis=0, ignore_index=True)
+    aristas = (aristas.groupby(['empresa_a', 'empresa_b'])
+               .agg(conteo=('conteo', 'sum'),
+                    primera=('primera', 'min'),
+                    ultima=('ultima', 'max'))
+               .reset_index())
+    return _desde_aristas(
+        aristas,
+        np.concatenate([red.nodos, nueva_red.nodos]),
+        np.concatenate([red.contratos, nueva_red.contratos]),
+    )
+
+
+def guardar_red(red: RedCoparticipacion, path: str):
+    np.savez(path, **red._asdict())
+
+
+def cargar_red(path: str) -> RedCoparticipacion:
+    with np.load(path) as arreglos:
+        return RedCoparticipacion(**{c: arreglos[c] for c in RedCoparticipacion._fields})
+
+
+def matriz_red(red: RedCoparticipacion) -> sparse.csr_matrix:
+    """Matriz de adyacencia con el número de contratos en común"""
+    n = red.nodos.shape[0]
+    return sparse.csr_matrix((red.conteos, red.indices, red.indptr), shape=(n, n))
+
+
+def _posicion(red: RedCoparticipacion, empresas) -> np.ndarray:
+    empresas = np.atleast_1d(np.asarray(empresas, dtype=str))
+    posicion = np.searchsorted(red.nodos, empresas)
+    posicion = np.clip(posicion, 0, max(red.nodos.shape[0] - 1, 0))
+    encontradas = red.nodos[posicion] == empresas
+    if not encontradas.all():
+        raise KeyError(f'{empresas[~encontradas].tolist()} no están en la red')
+    return posicion
+
+
+def socios_principales(red: RedCoparticipacion,
+                       empresa: str,
+                       k: int = 10) -> pd.DataFrame:
+    """Las k empresas con más contratos en común con empresa"""
+    i = _posicion(red, empresa)[0]
+    inicio, fin = red.indptr[i], red.indptr[i + 1]
+    conteos = red.conteos[inicio:fin]
+    # los empates quedan en orden alfabético
+    mejores = np.argsort(-conteos, kind='mergesort')[:k]
+    return pd.DataFrame({
+        'razon_social_simple': red.nodos[red.indices[inicio:fin][mejores]],
+        'conteo': conteos[mejores],
+        'primera': red.primera[inicio:fin][mejores],
+        'ultima': red.ultima[inicio:fin][mejores],
+    })
+
+
+def vecindario(red: RedCoparticipacion,
+               empresas,
+               saltos: int = 2) -> pd.DataFrame:
+    """Empresas a lo más a `saltos` aristas de las empresas indicadas, con
+    su distancia"""
+    matriz = matriz_red(red)
+    distancia = np.full(red.nodos.shape[0], -1, dtype=np.int32)
+    frontera = np.unique(_posicion(red, empresas))
+    distancia[frontera] = 0
+    for salto in range(1, saltos + 1):
+        if frontera.shape[0] == 0:
+            break
+        vecinos = np.unique(matriz[frontera].indices)
+        frontera = vecinos[distancia[vecinos] < 0]
+        distancia[frontera] = salto
+    alcanzados = np.flatnonzero(distancia >= 0)
+    resultado = pd.DataFrame({
+        'razon_social_simple': red.nodos[alcanzados],
+        'distancia': distancia[alcanzados],
+    })
+    return resultado.sort_values(['distancia', 'razon_social_simple'],
+                                 ignore_index=True)
+
+
+def componentes_ganadores(red: RedCoparticipacion,
+                          ganadores: List[str],
+                          conteo_min: int = 1) -> pd.DataFrame:
+    """Componentes conexas de la red restringida a las empresas ganadoras,
+    usando solo las aristas con al menos conteo_min contratos en común"""
+    ganadores = np.asarray(ganadores, dtype=str)
+    ganadores = np.unique(ganadores[np.isin(ganadores, red.nodos)])
+    if ganadores.shape[0] == 0:
+        return pd.DataFrame(columns=['razon_social_simple', 'componente',
+                                     'tamano_componente'])
+    posiciones = _posicion(red, ganadores)
+    matriz = matriz_red(red)[posiciones][:, posiciones]
+    matriz.data[matriz.data < conteo_min] = 0
+    matriz.eliminate_zeros()
+    _, etiquetas = csgraph.connected_components(matriz, directed=False)
+    resultado = pd.DataFrame({'razon_social_simple': ganadores,
+                              'componente': etiquetas})
+    tamano = resultado.groupby('componente').razon_social_simple.transform('size')
+    return resultado.assign(tamano_componente=tamano)
@@ -0,0 +1,109 @@
+"""Propagación del riesgo de los proveedores por la red de participación
+conjunta (ver red_coparticipacion).
+
+Se usa PageRank personalizado (caminata aleatoria con reinicio): en cada
+paso la caminata se mueve a un vecino con probabilidad proporcional al
+número de contratos en común o, con probabilidad 1 - alpha, regresa a una
+empresa semilla (las marcadas como riesgosas). El riesgo propagado de una
+empresa es la probabilidad estacionaria de la caminata en ella, por lo que
+las empresas que participan seguido con proveedores riesgosos reciben un
+valor alto aunque no tengan ninguna marca propia."""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from typing import Dict, Optional
+from .red_coparticipacion import RedCoparticipacion, matriz_red
+from .score import PESOS_FEATURES
+
+# features de features_binarios_proveedores que se usan como semilla, con
+# su peso en el score de riesgo
+PESOS_SEMILLA: Dict[str, float] = {
+    feature: PESOS_FEATURES[feature]
+    for feature in ['es_empresa_fantasma', 'empresa_sancionada',
+                    'empresa_no_localizada', 'misma_competencia_y_tasa_exito_alta']
+}
+
+
+def pagerank_personalizado(adyacencia: sparse.spmatrix,
+                           semillas: np.ndarray,
+                           alpha: float = 0.85,
+                           tol: float = 1e-10,
+                           max_iter: int = 200) -> np.ndarray:
+    """PageRank personalizado con iteraciones matriz dispersa-vector.
+
+    Parameters
+    ----------
+    adyacencia: sparse matrix
+        Pesos de las aristas (n x n)
+    semillas: np.ndarray
+        Peso de reinicio de cada nodo. Se normaliza para sumar uno
+    alpha: float
+        Probabilidad de seguir una arista en cada paso
+    tol: float
+        Se detiene cuando la norma L1 del cambio es menor a tol
+
+    Returns
+    -------
+    Probabilidad estacionaria de cada nodo (suma uno). Los nodos sin
+    aristas regresan su masa a las semillas
+    """
+    n = adyacencia.shape[0]
+    semillas = np.asarray(semillas, dtype=float)
+    if semillas.sum() <= 0:
+        return np.zeros(n)
+    semillas = semillas / semillas.sum()
+    adyacencia = sparse.csr_matrix(adyacencia, dtype=float)
+    grado = np.asarray(adyacencia.sum(axis=1)).ravel()
+    sin_aristas = grado == 0
+    inverso_grado = np.where(sin_aristas, 0, 1 / np.where(sin_aristas, 1, grado))
+    # x_{k+1} = alpha A^T D^{-1} x_k + (alpha * masa_sin_aristas + 1 - alpha) s
+    transpuesta = adyacencia.T.tocsr()
+    x = semillas.copy()
+    for _ in range(max_iter):
+        siguiente = alpha * (transpuesta @ (x * inverso_grado))
+        siguiente += (alpha * x[sin_aristas].sum() + 1 - alpha) * semillas
+        cambio = np.abs(siguiente - x).sum()
+        x = siguiente
+        if cambio < tol:
+            break
+    return x
+
+
+def riesgo_propagado(red: RedCoparticipacion,
+                     features_proveedores: pd.DataFrame,
+                     pesos: Optional[Dict[str, float]] = None,
+                     alpha: float = 0.85,
+                     tol: float = 1e-10) -> pd.DataFrame:
+    """Feature continuo riesgo_red por razon_social_simple.
+
+    Parameters
+    ----------
+    red: RedCoparticipacion
+        Red de participación conjunta, ver red_coparticipacion.construir_red
+    features_proveedores: pd.DataFrame
+        Resultado de features_binarios_proveedores
+    pesos: dict, opcional
+        feature -> peso de la semilla. Por default PESOS_SEMILLA
+
+    Returns
+    -------
+    Tabla con razon_social_simple y riesgo_red, la probabilidad
+    estacionaria multiplicada por el número de nodos (1 es el valor de una
+    caminata uniforme). Las empresas que no están en la red tienen 0
+    """
+    if pesos is None:
+        pesos = PESOS_SEMILLA
+    rs = 'razon_social_simple'
+    pesos = {c: p for c, p in pesos.items() if c in features_proveedores.columns}
+    peso_empresa = (features_proveedores.loc[:, list(pesos)].fillna(0)
+                    .to_numpy(dtype=float) @ np.array(list(pesos.values()), dtype=float))
+    posicion = pd.Index(red.nodos).get_indexer(features_proveedores[rs])
+    en_red = posicion >= 0
+    semillas = np.zeros(red.nodos.shape[0])
+    np.add.at(semillas, posicion[en_red], peso_empresa[en_red])
+    riesgo = pagerank_personalizado(matriz_red(red), semillas, alpha, tol)
+    riesgo = riesgo * red.nodos.shape[0]
+    feature = features_proveedores.loc[:, [rs]].assign(
+        riesgo_red=np.where(en_red, riesgo[np.where(en_red, posicion, 0)], 0)
+    )
+    return feature
@@ -0,0 +1,93 @@
+"""Score de riesgo a nivel contrato a partir de los features binarios de
+contrato, procedimiento y proveedor"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+PESOS_FEATURES: Dict[str, float] = {
+    'no_en_padron_proveedores': 1,
+    'es_empresa_fantasma': 3,
+    'empresa_no_localizada': 1,
+    'tasa_exito_alta': 1,
+    'empresa_reciente': 3,
+    'market_share_contratos_riesgoso': 1,
+    'market_share_monto_riesgoso': 1,
+    'empresa_sancionada': 3,
+    'no_encontrado_en_siscep': 2,
+    'discrepancia_inai_siscep': 1,
+    'solo_una_cotizacion': 2,
+    'falta_asistencia_junta': 1,
+    'solo_una_oferta': 2,
+    'participacion_baja': 1,
+    'periodo_corto_fecha_junta_fecha_convocatoria': 2,
+    'periodo_corto_fecha_contrato_fecha_junta': 2,
+    'tuvo_convenios_modificatorios': 1,
+    'plazo_corto_entrega': 2,
+    'misma_competencia_y_tasa_exito_alta': 3,
+}
+
+
+def solo_binarios(df: pd.DataFrame,
+                  llaves: list,
+                  pesos: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """Deja las llaves y las columnas de df que tienen peso en el score,
+    en el orden de df"""
+    if pesos is None:
+        pesos = PESOS_FEATURES
+    return df.loc[:, llaves + [c for c in df.columns if c in pesos and c not in llaves]]
+
+
+def features_binarios_nivel_contrato(procedimientos: pd.DataFrame,
+                                     features_proveedor: pd.DataFrame,
+                                     features_procedimiento: pd.DataFrame,
+                                     features_contrato: pd.DataFrame) -> pd.DataFrame:
+    """Une los features binarios a nivel (num_evento, numero_contrato,
+    razon_social_simple) y después los agrupa por contrato. Con la
+    agrupación de empresas los features con valores mayores a cero se
+    marcan como uno
+
+    Returns
+    -------
+    Tabla con num_evento, numero_contrato, monto y los features binarios
+    """
+    cols = ['num_evento', 'numero_contrato', 'razon_social_simple']
+    features_binarios = procedimientos.groupby(cols).monto.sum().reset_index()
+    features_binarios = pd.merge(
+        features_binarios, features_proveedor, 'left', 'razon_social_simple'
+    )
+    features_binarios = pd.merge(
+        features_binarios, features_procedimiento, 'left', 'num_evento'
+    )
+    features_binarios = pd.merge(
+        features_binarios, features_contrato, 'left', ['numero_contrato', 'num_evento']
+    )
+    # se agrupan los features de razon social y se deja la tabla a nivel contrato
+    df_nivel_contrato = (features_binarios.drop(columns='razon_social_simple')
+                         .groupby(['num_evento', 'numero_contrato']).sum())
+    features_cols = [c for c in df_nivel_contrato.columns if c != 'monto']
+    for c in features_cols:
+        df_nivel_contrato.loc[:, c] = np.where(df_nivel_contrato[c] > 0, 1, 0)
+    df_nivel_contrato = df_nivel_contrato.loc[:, ['monto'] + features_cols]
+    return df_nivel_contrato.reset_index()
+
+
+def score_riesgo(df_nivel_contrato: pd.DataFrame,
+                 pesos: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """Agrega sum_of_features, weighted_sum_of_features y
+    log_monto_times_weighted_sum al resultado de
+    features_binarios_nivel_contrato"""
+    if pesos is None:
+        pesos = PESOS_FEATURES
+    features_cols = [c for c in df_nivel_contrato.columns if c in pesos]
+    pesos = pd.Series(pesos).reindex(features_cols).to_numpy().reshape((len(features_cols), 1))
+    matriz_features = df_nivel_contrato.loc[:, features_cols].fillna(0).to_numpy()
+    df_nivel_contrato = df_nivel_contrato.assign(
+        sum_of_features=df_nivel_contrato[features_cols].fillna(0).sum(axis=1),
+        weighted_sum_of_features=pd.Series((matriz_features @ pesos).flatten()),
+    )
+    df_nivel_contrato = df_nivel_contrato.assign(
+        log_monto_times_weighted_sum=(
+            np.log(df_nivel_contrato.monto) * df_nivel_contrato.weighted_sum_of_features
+        )
+    )
+    return df_nivel_contrato
@@ -0,0 +1,230 @@
+"""Funciones para mantener los umbrales (cuantiles) de los features de forma
+incremental con sketches tipo t-digest.
+
+Un sketch es una tabla con las llaves del grupo (por ejemplo materia o
+empresa_productiva y materia), la variable y los centroides (media, peso).
+Los sketches se pueden combinar, por lo que basta agregar los contratos
+nuevos a los centroides guardados para actualizar los umbrales sin volver
+a leer la historia."""
+import joblib
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Tuple
+
+
+def comprimir_sketch(centroides: pd.DataFrame,
+                     llaves: List[str],
+                     compresion: int = 100) -> pd.DataFrame:
+    """Une los centroides cercanos de cada grupo con la escala
+    k(q) = compresion / (2 pi) * arcsin(2q - 1) del t-digest. Los extremos
+    de la distribución conservan centroides pequeños. Todos los grupos se
+    procesan a la vez"""
+    centroides = (centroides.sort_values(llaves + ['media'])
+                  .reset_index(drop=True))
+    grupos = centroides.groupby(llaves, sort=False).peso
+    total = grupos.transform('sum')
+    acumulado = grupos.cumsum() - centroides.peso
+    q = (acumulado + centroides.peso / 2) / total
+    k = compresion / (2 * np.pi) * np.arcsin(2 * q - 1) + compresion / 4
+    centroides = centroides.assign(
+        bin=np.floor(k).astype(int),
+        media_por_peso=centroides.media * centroides.peso,
+    )
+    centroides = (centroides.groupby(llaves + ['bin'], as_index=False)
+                  .agg({'media_por_peso': 'sum', 'peso': 'sum'}))
+    centroides = centroides.assign(
+        media=centroides.media_por_peso / centroides.peso
+    )
+    centroides = centroides.loc[:, llaves + ['media', 'peso']]
+    return centroides
+
+
+def crear_sketch(df: pd.DataFrame,
+                 llaves: List[str],
+                 columnas: List[str],
+                 compresion: int = 100) -> pd.DataFrame:
+    """Genera el sketch de cada columna por grupo de llaves. Los valores
+    nulos se ignoran"""
+    valores = df.melt(id_vars=llaves, value_vars=columnas,
+                      var_name='variable', value_name='media')
+    valores = valores.dropna(subset=llaves + ['media']).assign(peso=1.0)
+    return comprimir_sketch(valores, llaves + ['variable'], compresion)
+
+
+def combinar_sketches(sketches: List[pd.DataFrame],
+                      llaves: List[str],
+                      compresion: int = 100) -> pd.DataFrame:
+    """Combina varios sketches con las mismas llaves"""
+    centroides = pd.concat(sketches, axis=0, ignore_index=True, sort=False)
+    return comprimir_sketch(centroides, llaves + ['variable'], compresion)
+
+
+def actualizar_sketch(sketch: Optional[pd.DataFrame],
+                      nuevos: pd.DataFrame,
+                      llaves: List[str],
+                      columnas: List[str],
+                      compresion: int = 100) -> pd.DataFrame:
+    """Agrega al sketch solo los registros nuevos"""
+    sketch_nuevos = crear_sketch(nuevos, llaves, columnas, compresion)
+    if sketch is None:
+        return sketch_nuevos
+    return combinar_sketches([sketch, sketch_nuevos], llaves, compresion)
+
+
+def cuantiles_sketch(sketch: pd.DataFrame,
+                     llaves: List[str],
+                     cuantil: float) -> pd.DataFrame:
+    """Estima el cuantil de cada grupo y variable del sketch.
+
+    Cada centroide se ubica en la posición promedio de los valores que
+    resume y se interpola linealmente, igual que pd.Series.quantile. Si
+    ningún centroide se ha comprimido el resultado es exacto.
+
+    Returns
+    -------
+    Tabla con llaves, variable y umbral
+    """
+    llaves = llaves + ['variable']
+    centroides = sketch.sort_values(llaves + ['media']).reset_index(drop=True)
+    codigos = centroides.groupby(llaves, sort=False).ngroup().to_numpy()
+    pesos = centroides.peso.to_numpy()
+    medias = centroides.media.to_numpy()
+    grupos = centroides.groupby(llaves, sort=False).peso
+    acumulado = (grupos.cumsum() - centroides.peso).to_numpy()
+    total = grupos.sum().to_numpy()
+    inicio = np.r_[0, np.cumsum(grupos.size().to_numpy())[:-1]]
+    fin = inicio + grupos.size().to_numpy() - 1
+    # posición de cada centroide y del cuantil buscado (base cero). Se
+    # desplaza cada grupo para hacer una sola búsqueda en todo el arreglo
+    desplazamiento = np.r_[0, np.cumsum(total)[:-1]]
+    posicion = acumulado + (pesos - 1) / 2 + desplazamiento[codigos]
+    objetivo = cuantil * (total - 1) + desplazamiento
+    derecha = np.clip(np.searchsorted(posicion, objetivo), inicio, fin)
+    izquierda = np.clip(derecha - 1, inicio, fin)
+    ancho = posicion[derecha] - posicion[izquierda]
+    fraccion = np.where(
+        ancho > 0,
+        (objetivo - posicion[izquierda]) / np.where(ancho > 0, ancho, 1),
+        1.0,
+    )
+    fraccion = np.clip(fraccion, 0, 1)
+    umbral = medias[izquierda] + fraccion * (medias[derecha] - medias[izquierda])
+    umbrales = centroides.loc[inicio, llaves].reset_index(drop=True)
+    umbrales = umbrales.assign(umbral=umbral)
+    return umbrales
+
+
+def marcar_con_umbrales(df: pd.DataFrame,
+                        umbrales: pd.DataFrame,
+                        llaves: List[str],
+                        columna: str,
+                        mayor: bool = False) -> pd.Series:
+    """Compara cada renglón contra el umbral de su grupo con un cruce por
+    llaves (O(1) por renglón). Regresa 1 si el valor está debajo del umbral
+    (o encima si mayor es True), 0 si no y nulo si el grupo no tiene umbral"""
+    umbral = umbrales.loc[umbrales.variable == columna, llaves + ['umbral']]
+    umbral = pd.merge(df.loc[:, llaves], umbral, 'left', on=llaves).umbral
+    umbral = pd.Series(umbral.to_numpy(), index=df.index)
+    if mayor:
+        marca = df[columna] > umbral
+    else:
+        marca = df[columna] < umbral
+    return marca.astype(int).where(~umbral.isna())
+
+
+def bootstrap_cuantil(valores: np.ndarray,
+                      cuantil: float,
+                      n_bootstrap: int,
+                      semilla: np.random.SeedSequence,
+                      tamano_lote: int = 2_000_000) -> np.ndarray:
+    """Regresa n_bootstrap estimaciones del cuantil de valores. Los
+    remuestreos se generan como matrices de índices (lote x n) para no
+    iterar por réplica"""
+    rng = np.random.default_rng(semilla)
+    n = valores.shape[0]
+    lote = max(1, tamano_lote // max(n, 1))
+    estimaciones = []
+    for inicio in range(0, n_bootstrap, lote):
+        b = min(lote, n_bootstrap - inicio)
+        indices = rng.integers(0, n, size=(b, n))
+        estimaciones.append(np.quantile(valores[indices], cuantil, axis=1))
+    return np.concatenate(estimaciones)
+
+
+def intervalos_bootstrap(df: pd.DataFrame,
+                         llaves: List[str],
+                         columna: str,
+                         cuantil: float,
+                         mayor: bool = False,
+                         n_bootstrap: int = 1000,
+                         alpha: float = 0.05,
+                         n_jobs: int = -1,
+                         semilla: int = 0) -> Tuple[pd.DataFrame, pd.Series]:
+    """Intervalos de confianza bootstrap del umbral (cuantil) de cada grupo
+    y estabilidad del feature binario de cada renglón.
+
+    Los grupos se procesan en paralelo con hilos. La estabilidad es la
+    proporción de réplicas en las que el renglón conserva la marca que
+    obtiene con el cuantil puntual (valor < umbral, o > si mayor es True).
+
+    Returns
+    -------
+    Tabla con llaves, umbral, umbral_inferior y umbral_superior, y una
+    serie con la estabilidad de cada renglón de df (nula si el valor o el
+    umbral son nulos)
+    """
+    data = df.loc[:, llaves + [columna]].dropna(subset=llaves)
+    grupos = [(llave, g[columna]) for llave, g in data.groupby(llaves)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(grupos))
+
+    def procesar(valores_grupo: pd.Series, semilla_grupo) -> Tuple:
+        valores = valores_grupo.dropna().to_numpy()
+        estabilidad = pd.Series(np.nan, index=valores_grupo.index)
+        if valores.shape[0] == 0:
+            return (np.nan, np.nan, np.nan), estabilidad
+        puntual = np.quantile(valores, cuantil)
+        replicas = np.sort(
+            bootstrap_cuantil(valores, cuantil, n_bootstrap, semilla_grupo)
+        )
+        x = valores_grupo.to_numpy()
+        con_valor = ~np.isnan(x)
+        if mayor:
+            # réplicas con umbral < x
+            marcadas = np.searchsorted(replicas, x[con_valor], side='left')
+            marca = x[con_valor] > puntual
+        else:
+            # réplicas con umbral > x
+            marcadas = n_bootstrap - np.searchsorted(replicas, x[con_valor], side='right')
+            marca = x[con_valor] < puntual
+        proporcion = marcadas / n_bootstrap
+        estabilidad[con_valor] = np.where(marca, proporcion, 1 - proporcion)
+        limites = np.quantile(replicas, [alpha / 2, 1 - alpha / 2])
+        return (puntual, limites[0], limites[1]), estabilidad
+
+    resultados = joblib.Parallel(n_jobs=n_jobs, prefer='threads')(
+        joblib.delayed(procesar)(valores, semilla_grupo)
+        for (_, valores), semilla_grupo in zip(grupos, semillas)
+    )
+    registros = []
+    for (llave, _), (umbrales, _) in zip(grupos, resultados):
+        llave = llave if isinstance(llave, tuple) else (llave,)
+        registro = dict(zip(llaves, llave))
+        registro.update(zip(['umbral', 'umbral_inferior', 'umbral_superior'], umbrales))
+        registros.append(registro)
+    intervalos = pd.DataFrame(
+        registros,
+        columns=llaves + ['umbral', 'umbral_inferior', 'umbral_superior']
+    )
+    estabilidad = pd.Series(np.nan, index=df.index)
+    if len(resultados):
+        estabilidad_grupos = pd.concat([e for _, e in resultados])
+        estabilidad.loc[estabilidad_grupos.index] = estabilidad_grupos
+    return intervalos, estabilidad
+
+
+def guardar_sketch(sketch: pd.DataFrame, path: str):
+    sketch.to_csv(path, index=False, quoting=1, encoding='utf-8')
+
+
+def cargar_sketch(path: str) -> pd.DataFrame:
+    return pd.read_csv(path)
@@ -0,0 +1,166 @@
+"""Funciones para indexar los documentos descargados del siscep
+(ver scripts/descargar_info_siscep.py) y calcular qué etapas de cada
+procedimiento tienen documentación"""
+
+import os
+import re
+import joblib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+from .preprocess import remove_accents
+
+# Patrones para clasificar los archivos por etapa. Se revisan en este orden
+# y el archivo se asigna a la primera etapa que coincida, por ejemplo el
+# "acta de diferimiento del fallo" es diferimiento y no asignacion
+PATRONES_ETAPAS: Dict[str, str] = {
+    "diferimiento": r"diferimiento|difiere|diferir",
+    "preguntas_aclaraciones": r"junta|aclaracion|pregunta|respuesta",
+    "entrega_propuesta": r"propuesta|apertura|oferta|proposicion",
+    "asignacion": r"fallo|adjudicacion|asignacion|contrato",
+    "publicacion": r"convocatoria|bases|publicacion|invitacion|anexo",
+}
+
+# orden de las columnas que espera documentacion_faltante_concursos_abiertos
+ETAPAS: List[str] = [
+    "publicacion",
+    "preguntas_aclaraciones",
+    "entrega_propuesta",
+    "asignacion",
+    "diferimiento",
+]
+
+COLUMNAS_INDICE: List[str] = [
+    "procedimiento",
+    "negocio",
+    "data_itemid",
+    "mtime",
+    "archivos",
+] + ETAPAS
+
+
+def clasificar_archivo(nombre: str) -> Optional[str]:
+    """Regresa la etapa a la que pertenece un archivo según su nombre
+    o None si no coincide con ningún patrón"""
+    nombre = remove_accents(nombre.lower())
+    for etapa, patron in PATRONES_ETAPAS.items():
+        if re.search(patron, nombre):
+            return etapa
+    return None
+
+
+def escanear_carpeta(path: str) -> Dict[str, int]:
+    """Cuenta los archivos de la carpeta de un data_itemid por etapa"""
+    conteo = dict.fromkeys(ETAPAS, 0)
+    archivos = 0
+    with os.scandir(path) as entradas:
+        for entrada in entradas:
+            if not entrada.is_file():
+                continue
+            archivos += 1
+            etapa = clasificar_archivo(entrada.name)
+            if etapa is not None:
+                conteo[etapa] += 1
+    conteo["archivos"] = archivos
+    return conteo
+
+
+def carpetas_documentos(base_path: str) -> pd.DataFrame:
+    """Lista las carpetas base_path/procedimiento/negocio/data_itemid con la
+    fecha de modificación de cada una (en nanosegundos)"""
+    registros = []
+    for path_negocio in Path(base_path).glob("*/*"):
+        if not path_negocio.is_dir():
+            continue
+        with os.scandir(path_negocio) as entradas:
+            for entrada in entradas:
+                if entrada.is_dir() and entrada.name.isnumeric():
+                    registros.append(
+                        {
+                            "procedimiento": path_negocio.parent.name,
+                            "negocio": path_negocio.name,
+                            "data_itemid": int(entrada.name),
+                            "mtime": entrada.stat().st_mtime_ns,
+                            "path": entrada.path,
+                        }
+                    )
+    columns = ["procedimiento", "negocio", "data_itemid", "mtime", "path"]
+    return pd.DataFrame(registros, columns=columns)
+
+
+def indexar_documentos(
+    base_path: str, path_indice: Optional[str] = None, n_jobs: int = -1
+) -> pd.DataFrame:
+    """Construye el índice de documentos del siscep por data_itemid.
+
+    Si path_indice existe, solo se vuelven a escanear las carpetas nuevas o
+    cuya fecha de modificación cambió y se eliminan las que ya no existen.
+    Los escaneos se hacen en paralelo con hilos. Si se indica path_indice el
+    índice actualizado se guarda ahí.
+
+    Returns
+    -------
+    Tabla con procedimiento, negocio, data_itemid, mtime, número de
+    archivos y número de archivos por etapa
+    """
+    llaves = ["procedimiento", "negocio", "data_itemid"]
+    carpetas = carpetas_documentos(base_path)
+    sin_cambios = np.zeros(carpetas.shape[0], dtype=bool)
+    vigentes = pd.DataFrame(columns=COLUMNAS_INDICE)
+    if path_indice is not None and Path(path_indice).exists():
+        previo = pd.read_csv(path_indice, dtype={"procedimiento": str, "negocio": str})
+        # las carpetas sin cambios conservan su registro anterior
+        cruce = pd.merge(
+            carpetas,
+            previo.loc[:, llaves + ["mtime"]],
+            "left",
+            on=llaves,
+            suffixes=("", "_previo"),
+        )
+        sin_cambios = (cruce.mtime == cruce.mtime_previo).to_numpy()
+        vigentes = pd.merge(
+            previo, carpetas.loc[sin_cambios, llaves + ["mtime"]], on=llaves + ["mtime"]
+        )
+    por_escanear = carpetas.loc[~sin_cambios]
+    conteos = joblib.Parallel(n_jobs=n_jobs, prefer="threads")(
+        joblib.delayed(escanear_carpeta)(path) for path in por_escanear.path
+    )
+    nuevos = pd.DataFrame(conteos, index=por_escanear.index)
+    nuevos = pd.concat([por_escanear.drop("path", axis=1), nuevos], axis=1)
+    indice = (
+        pd.concat([vigentes, nuevos], axis=0, ignore_index=True, sort=False)
+        .reindex(columns=COLUMNAS_INDICE)
+        .fillna({c: 0 for c in ["archivos"] + ETAPAS})
+        .astype({c: np.int64 for c in ["data_itemid", "mtime", "archivos"] + ETAPAS})
+        .sort_values(llaves)
+        .reset_index(drop=True)
+    )
+    if path_indice is not None:
+        indice.to_csv(path_indice, index=False, quoting=1, encoding="utf-8")
+    return indice
+
+
+def tabla_archivos(
+    indice: pd.DataFrame, ids: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """Genera la tabla df_archivos que usan
+    features.documentacion_faltante_concursos_abiertos y
+    visualization.cumplimiento_documentos_concursos_abiertos.
+
+    Parameters
+    ----------
+    indice: pd.DataFrame
+        Resultado de indexar_documentos
+    ids: pd.DataFrame, opcional
+        Relación entre data_itemid e id_unico. Si no se indica se usa el
+        data_itemid como id_unico
+    """
+    if ids is None:
+        archivos = indice.assign(id_unico=indice.data_itemid)
+    else:
+        archivos = pd.merge(
+            indice, ids.loc[:, ["data_itemid", "id_unico"]], on="data_itemid"
+        )
+    archivos = archivos.groupby("id_unico", as_index=False)[ETAPAS].sum()
+    return archivos
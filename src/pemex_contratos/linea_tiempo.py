@@ -0,0 +1,79 @@
+"""Funciones para construir la línea de tiempo de los procedimientos y
+calcular la duración entre sus etapas"""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+# Valor con el que se marcan las etapas sin fecha en la matriz int32
+SIN_FECHA = np.iinfo(np.int32).min
+
+# etapa -> columna con la fecha en la tabla del siscep
+ETAPAS_SISCEP: Dict[str, str] = {
+    "publicado": "publicado",
+    "preguntas_y_respuestas": "fecha_preguntas_y_respuestas",
+    "recepcion_propuestas": "fecha_recepcion_propuestas",
+    "fallo": "fecha_fallo",
+}
+
+# etapa -> columna con la fecha en la tabla del inai
+ETAPAS_INAI: Dict[str, str] = {
+    "convocatoria": "fecha_convocatoria",
+    "junta_aclaraciones": "fecha_junta_aclaraciones",
+    "contrato": "fecha_del_contrato",
+    "inicio_plazo": "fecha_inicio_plazo_entrega",
+    "termino_plazo": "fecha_termino_plazo_entrega",
+}
+
+
+def linea_tiempo(
+    df: pd.DataFrame, etapas: Dict[str, str], llaves: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """Junta las fechas de las etapas en una tabla de enteros int32 con los
+    días transcurridos desde 1970-01-01.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Tabla con las columnas de fechas
+    etapas: dict
+        Mapeo de nombre de etapa a columna de fecha. El orden del
+        diccionario es el orden de las etapas
+    llaves: list, opcional
+        Si se indica, se toma la fecha mínima de cada etapa por
+        procedimiento. Si no, se regresa un renglón por renglón de df
+
+    Returns
+    -------
+    Tabla con una columna int32 por etapa. Las fechas faltantes
+    tienen el valor SIN_FECHA
+    """
+    columnas = list(etapas.values())
+    if llaves is not None:
+        data = df.groupby(llaves)[columnas].min()
+    else:
+        data = df.loc[:, columnas]
+    matriz = np.full(data.shape, SIN_FECHA, dtype=np.int32)
+    for j, columna in enumerate(columnas):
+        fechas = data[columna].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        con_fecha = ~np.isnat(fechas)
+        matriz[con_fecha, j] = fechas[con_fecha].astype(np.int64)
+    linea = pd.DataFrame(matriz, index=data.index, columns=list(etapas.keys()))
+    return linea
+
+
+def duraciones(linea: pd.DataFrame) -> pd.DataFrame:
+    """Calcula los días entre todos los pares de etapas de la línea de
+    tiempo en una sola operación vectorizada.
+
+    Returns
+    -------
+    Tabla con una columna dias_{inicio}_a_{fin} por par de etapas y el
+    mismo índice que la línea de tiempo. Es nulo si falta alguna fecha
+    """
+    matriz = linea.to_numpy()
+    etapas = list(linea.columns)
+    inicio, fin = np.triu_indices(len(etapas), k=1)
+    con_fecha = (matriz[:, inicio] != SIN_FECHA) & (matriz[:, fin] != SIN_FECHA)
+    dias = np.where(con_fecha, matriz[:, fin] - matriz[:, inicio], np.nan)
+    columnas = [f"dias_{etapas[i]}_a_{etapas[j]}" for i, j in zip(inicio, fin)]
+    return pd.DataFrame(dias, index=linea.index, columns=columnas)
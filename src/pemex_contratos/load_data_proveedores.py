@@ -61,6 +61,67 @@ def cargar_lista_contribuyentes_69b(path):
     return df
 
 
+# Columnas con las fechas de publicación de cada situación del listado 69-B.
+# La primera es la publicación en la página del SAT y la segunda en el DOF
+FECHAS_SITUACION_69B = {
+    'Presunto': ['Publicación página SAT presuntos', 'Publicación DOF presuntos'],
+    'Desvirtuado': ['Publicación página SAT desvirtuados',
+                    'Publicación DOF desvirtuados'],
+    'Definitivo': ['Publicación página SAT definitivos',
+                   'Publicación DOF definitivos'],
+    'Sentencia Favorable': ['Publicación página SAT sentencia favorable',
+                            'Publicación DOF sentencia favorable'],
+}
+
+
+def cargar_intervalos_69b(path):
+    """Carga el Listado completo del artículo 69 B con el periodo en el
+    que estuvo vigente cada situación del contribuyente.
+
+    Cada contribuyente genera un registro por situación publicada
+    (Presunto, Desvirtuado, Definitivo, Sentencia Favorable). La situación
+    inicia con su fecha de publicación y termina cuando se publica la
+    siguiente; la última queda abierta (``fecha_fin`` nula).
+    Parameters
+    ----------
+    path: str
+        Ruta del archivo descargado de la página
+    Returns
+    -------
+        Tabla con RFC, razon_social, situacion_contribuyente,
+        fecha_inicio y fecha_fin
+    """
+    cols_fechas = [c for cols in FECHAS_SITUACION_69B.values() for c in cols]
+    df = pd.read_csv(
+        path,
+        encoding="iso-8859-1",
+        skiprows=2,
+        usecols=["RFC", "Nombre del Contribuyente"] + cols_fechas,
+    )
+    df = df.rename(columns={"Nombre del Contribuyente": "razon_social"})
+    rs = df.razon_social.fillna('').astype(str).str.upper().str.strip()
+    rs = homologar_razon_social(rs).replace('', np.nan)
+    df = df.assign(razon_social=rs)
+    # una fila por contribuyente y situación publicada
+    dfs = []
+    for situacion, (col_sat, col_dof) in FECHAS_SITUACION_69B.items():
+        fecha_sat = pd.to_datetime(df[col_sat], dayfirst=True, errors='coerce')
+        fecha_dof = pd.to_datetime(df[col_dof], dayfirst=True, errors='coerce')
+        df_situacion = df.loc[:, ['RFC', 'razon_social']].assign(
+            situacion_contribuyente=situacion,
+            fecha_inicio=fecha_sat.fillna(fecha_dof),
+        )
+        dfs.append(df_situacion.loc[~df_situacion.fecha_inicio.isna()])
+    intervalos = (pd.concat(dfs, axis=0, ignore_index=True)
+                  .sort_values(['RFC', 'fecha_inicio'])
+                  .reset_index(drop=True))
+    # cada situación termina cuando se publica la siguiente
+    fecha_fin = intervalos.groupby('RFC').fecha_inicio.shift(-1)
+    intervalos = intervalos.assign(fecha_fin=fecha_fin)
+    intervalos = intervalos.dropna(subset=['RFC']).drop_duplicates()
+    return intervalos
+
+
 def cargar_particulares_sancionados(path):
     names = {'nombre_razon_social': 'razon_social', 'rfc': 'RFC'}
     df = pd.read_json(path)
@@ -0,0 +1,80 @@
+"""Proyección de columnas para las funciones de features.
+
+Las funciones de features solo leen unas cuantas columnas de la tabla de
+procedimientos. Con el decorador lee_columnas cada función declara esas
+columnas y recibe únicamente esa proyección, en lugar de copiar la tabla
+completa. La proyección es una copia de esas columnas, no una vista, así
+que la función puede agregarle columnas sin tocar la tabla original."""
+
+import functools
+import inspect
+import sys
+import numpy as np
+import pandas as pd
+from typing import Callable, Iterable, Tuple
+
+
+def proyectar(df: pd.DataFrame, columnas: Iterable[str]) -> pd.DataFrame:
+    """Regresa una copia de df con solo las columnas indicadas (sin
+    repetir)"""
+    return df.loc[:, list(dict.fromkeys(columnas))]
+
+
+def lee_columnas(*columnas: str, opcionales: Tuple[str, ...] = ()) -> Callable:
+    """Decorador para funciones cuyo primer argumento es la tabla de
+    procedimientos.
+
+    Parameters
+    ----------
+    columnas: str
+        Columnas que lee la función
+    opcionales: tuple
+        Nombres de argumentos de la función que indican una columna
+        adicional, por ejemplo fecha_col. Si el argumento es None no se
+        agrega ninguna columna
+
+    La función decorada guarda las columnas declaradas en el atributo
+    columnas
+    """
+
+    def decorador(funcion: Callable) -> Callable:
+        firma = inspect.signature(funcion)
+        tabla = next(iter(firma.parameters))
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            argumentos = firma.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+            extra = [
+                argumentos.arguments[o]
+                for o in opcionales
+                if argumentos.arguments[o] is not None
+            ]
+            argumentos.arguments[tabla] = proyectar(
+                argumentos.arguments[tabla], list(columnas) + extra
+            )
+            return funcion(*argumentos.args, **argumentos.kwargs)
+
+        envoltura.columnas = columnas
+        return envoltura
+
+    return decorador
+
+
+def memoria_maxima_mb() -> float:
+    """Memoria residente máxima (RSS) del proceso en MB. ru_maxrss viene
+    en KB en Linux y en bytes en macOS. Donde no existe el módulo resource
+    (Windows) se usa psutil si está instalado, o nulo si no"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return np.nan
+        memoria = psutil.Process().memory_info()
+        return getattr(memoria, "peak_wset", memoria.rss) / 1024**2
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return maxrss / 1024**2
+    return maxrss / 1024
@@ -0,0 +1,167 @@
+"""Agregados por signatario de PEMEX: contratos, montos, concentración de
+proveedores (índice de Herfindahl), proporción de adjudicaciones directas y
+riesgo promedio de sus contratos.
+
+Los agregados se guardan como estadísticas suficientes (sumas y conteos
+por signatario y por par signatario-proveedor) en un EstadoSignatarios, de
+modo que al llegar contratos nuevos solo se suman sus estadísticas a las
+guardadas, sin volver a procesar toda la historia."""
+
+import numpy as np
+import pandas as pd
+from typing import NamedTuple, Optional
+
+
+class EstadoSignatarios(NamedTuple):
+    signatarios: np.ndarray  # signatario_pemex, ordenados
+    contratos: np.ndarray  # adjudicaciones por signatario
+    monto: np.ndarray
+    directas: np.ndarray  # adjudicaciones directas
+    suma_riesgo: np.ndarray
+    con_riesgo: np.ndarray  # contratos con score de riesgo
+    par_signatario: np.ndarray  # posición en signatarios de cada par
+    par_empresa: np.ndarray  # empresa ganadora de cada par
+    par_contratos: np.ndarray
+    par_monto: np.ndarray
+
+
+def _agregar(
+    signatario: np.ndarray, empresa: np.ndarray, valores: dict, valores_par: dict
+) -> EstadoSignatarios:
+    """Suma los valores por signatario y por (signatario, empresa) con
+    llaves factorizadas y bincount"""
+    codigo, signatarios = pd.factorize(signatario, sort=True)
+    n = signatarios.shape[0]
+    sumas = {c: np.bincount(codigo, v, minlength=n) for c, v in valores.items()}
+    codigo_empresa, empresas = pd.factorize(empresa, sort=True)
+    pares, inverso = np.unique(
+        codigo.astype(np.int64) * max(empresas.shape[0], 1) + codigo_empresa,
+        return_inverse=True,
+    )
+    sumas_par = {
+        c: np.bincount(inverso, v, minlength=pares.shape[0])
+        for c, v in valores_par.items()
+    }
+    return EstadoSignatarios(
+        signatarios=np.asarray(signatarios, dtype=str),
+        par_signatario=pares // max(empresas.shape[0], 1),
+        par_empresa=np.asarray(empresas, dtype=str)[pares % max(empresas.shape[0], 1)],
+        **sumas,
+        **sumas_par,
+    )
+
+
+def estadisticas_signatarios(
+    df: pd.DataFrame,
+    score_col: Optional[str] = None,
+    estado: Optional[EstadoSignatarios] = None,
+) -> EstadoSignatarios:
+    """Calcula las estadísticas de los contratos adjudicados de df o se
+    las agrega a estado.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Tabla del siscep con id_unico, signatario_pemex, empresa_ganadora,
+        montos_maximos_mxn, tipo_contratacion y Resultado. Para actualizar
+        un estado solo debe traer los contratos nuevos
+    score_col: str, opcional
+        Columna de df con el score de riesgo de cada contrato
+    """
+    cols = ["id_unico", "signatario_pemex", "empresa_ganadora"]
+    data = df.loc[
+        (df.Resultado == "ADJUDICADA") & ~df.signatario_pemex.isna()
+    ].drop_duplicates(cols)
+    monto = data.montos_maximos_mxn.fillna(0).to_numpy(dtype=float)
+    riesgo = (
+        data[score_col].to_numpy(dtype=float)
+        if score_col is not None
+        else np.full(data.shape[0], np.nan)
+    )
+    valores = {
+        "contratos": np.ones(data.shape[0]),
+        "monto": monto,
+        "directas": (data.tipo_contratacion == "adjudicacion").to_numpy(dtype=float),
+        "suma_riesgo": np.nan_to_num(riesgo),
+        "con_riesgo": (~np.isnan(riesgo)).astype(float),
+    }
+    signatario = data.signatario_pemex.to_numpy(dtype=str)
+    empresa = data.empresa_ganadora.fillna("").to_numpy(dtype=str)
+    # las adjudicaciones sin empresa ganadora cuentan para el signatario
+    # pero no forman un par, para que la concentración sea solo de
+    # proveedores reales
+    con_empresa = (empresa != "").astype(float)
+    valores_par = {"par_contratos": con_empresa, "par_monto": monto * con_empresa}
+    if estado is not None:
+        # se suman a las estadísticas guardadas como si fueran renglones
+        signatario = np.concatenate(
+            [signatario, estado.signatarios, estado.signatarios[estado.par_signatario]]
+        )
+        empresa = np.concatenate(
+            [empresa, np.full(estado.signatarios.shape[0], ""), estado.par_empresa]
+        )
+        n_pares = estado.par_signatario.shape[0]
+        n_signatarios = estado.signatarios.shape[0]
+        for c in valores:
+            valores[c] = np.concatenate(
+                [valores[c], getattr(estado, c), np.zeros(n_pares)]
+            )
+        for c in valores_par:
+            valores_par[c] = np.concatenate(
+                [valores_par[c], np.zeros(n_signatarios), getattr(estado, c)]
+            )
+    estado = _agregar(signatario, empresa, valores, valores_par)
+    # los renglones del estado anterior agregan pares vacíos
+    con_valor = (estado.par_contratos > 0) | (estado.par_monto > 0)
+    return estado._replace(
+        par_signatario=estado.par_signatario[con_valor],
+        par_empresa=estado.par_empresa[con_valor],
+        par_contratos=estado.par_contratos[con_valor],
+        par_monto=estado.par_monto[con_valor],
+    )
+
+
+def resumen_signatarios(estado: EstadoSignatarios) -> pd.DataFrame:
+    """Tabla por signatario_pemex con contratos, monto, proveedores,
+    hhi_proveedores_contratos, hhi_proveedores_monto,
+    proporcion_adjudicacion_directa y riesgo_promedio. Los índices de
+    Herfindahl solo usan las adjudicaciones con empresa ganadora y son
+    nulos si el signatario no tiene ninguna"""
+    n = estado.signatarios.shape[0]
+    # totales de los pares, sin las adjudicaciones sin empresa ganadora
+    contratos_pares = np.bincount(estado.par_signatario, estado.par_contratos, n)
+    monto_pares = np.bincount(estado.par_signatario, estado.par_monto, n)
+    contratos = contratos_pares[estado.par_signatario]
+    monto = monto_pares[estado.par_signatario]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hhi_contratos = np.bincount(
+            estado.par_signatario, (estado.par_contratos / contratos) ** 2, n
+        )
+        hhi_monto = np.bincount(
+            estado.par_signatario, (estado.par_monto / monto) ** 2, n
+        )
+        riesgo = estado.suma_riesgo / estado.con_riesgo
+    resumen = pd.DataFrame(
+        {
+            "signatario_pemex": estado.signatarios,
+            "contratos": estado.contratos.astype(int),
+            "monto": estado.monto,
+            "proveedores": np.bincount(estado.par_signatario, minlength=n),
+            "hhi_proveedores_contratos": np.where(
+                contratos_pares > 0, hhi_contratos, np.nan
+            ),
+            "hhi_proveedores_monto": np.where(monto_pares > 0, hhi_monto, np.nan),
+            "proporcion_adjudicacion_directa": estado.directas / estado.contratos,
+            "riesgo_promedio": riesgo,
+        }
+    )
+    return resumen
+
+
+def guardar_estado(estado: EstadoSignatarios, path: str):
+    np.savez(path, **estado._asdict())
+
+
+def cargar_estado(path: str) -> EstadoSignatarios:
+    with np.load(path) as arreglos:
+        return EstadoSignatarios(**{c: arreglos[c] for c in EstadoSignatarios._fields})
@@ -6,18 +6,17 @@ import pandas as pd
 import holoviews as hv
 import numpy as np
 from datetime import date
+from .features import market_share
+from .linea_tiempo import ETAPAS_SISCEP, duraciones, linea_tiempo
 
 EMPRESAS_IRRELEVANTES = {"PFE", "PPS", "PEE"}
 
 
 def calcular_nhhi(df: pd.DataFrame, column: str) -> float:
-    df_pcs = (
-        df.stb.freq(["empresa_ganadora"], value=column)
-        .drop([f"Cumulative {column}", "Cumulative Percent", column], axis=1)
-        .rename(columns={"Percent": f"pc_{column}"})
-    )
-    n_empresas = df_pcs.empresa_ganadora.nunique()
-    hhi = df_pcs[f"pc_{column}"].pow(2).sum()
+    pcs = df.groupby("empresa_ganadora")[column].sum()
+    pcs = pcs.divide(pcs.sum())
+    n_empresas = pcs.shape[0]
+    hhi = pcs.pow(2).sum()
     nhhi = (hhi - (1 / n_empresas)) / (1 - (1 / n_empresas))
     return nhhi
 
@@ -72,33 +71,19 @@ def porcentaje_contrataciones_y_monto_empresa_productiva(df: pd.DataFrame, value
         .reset_index()
         .rename(columns={"id_unico": "contrataciones", "montos_maximos_mxn": "monto"})
     )
-    empresas = {
-        e for e in data.empresa_productiva.unique() if e not in EMPRESAS_IRRELEVANTES
-    }
     data = data.loc[~data.empresa_productiva.isin(EMPRESAS_IRRELEVANTES)]
-    dfs = []
-    for v in ["contrataciones", "monto"]:
-        dfs_empresas = []
-        for e in empresas:
-            df_empresa = data.loc[data.empresa_productiva == e]
-            if df_empresa.shape[0] == 0:
-                continue
-            df_aux = (
-                df_empresa.stb.freq(["tipo_contratacion"], value=v)
-                .drop([f"Cumulative {v}", "Cumulative Percent", v], axis=1)
-                .rename(columns={"Percent": f"pc_{v}"})
-            )
-            df_aux = df_aux.assign(empresa_productiva=e)
-            dfs_empresas.append(df_aux)
-        df_pcs = pd.concat(dfs_empresas, axis=0, ignore_index=True)
-        dfs.append(df_pcs)
-
+    dfs = [
+        market_share(
+            data,
+            ["empresa_productiva"],
+            valor=v,
+            entidad="tipo_contratacion",
+            ancho=False,
+        ).drop(v, axis=1)
+        for v in ["contrataciones", "monto"]
+    ]
     df_join = pd.merge(dfs[0], dfs[1], on=["empresa_productiva", "tipo_contratacion"])
     df_join = df_join.sort_values(["empresa_productiva", "tipo_contratacion"])
-    df_join = df_join.assign(
-        pc_monto=df_join.pc_monto * 100,
-        pc_contrataciones=df_join.pc_contrataciones * 100,
-    )
     options = {
         "width": 500,
         "height": 300,
@@ -171,9 +156,9 @@ def dias_fallo_propuestas_tipo_contratacion(df: pd.DataFrame):
         "fecha_fallo",
     ]
     cond = (df.tipo_contratacion != "adjudicacion") & (df.Resultado == "ADJUDICADA")
-    data = df.loc[cond, cols]
-    delta_dias = data.fecha_fallo - data.fecha_recepcion_propuestas
-    data = data.assign(delta_dias=delta_dias.dt.days)
+    data = df.loc[cond]
+    dias = duraciones(linea_tiempo(data, ETAPAS_SISCEP))
+    data = data.loc[:, cols].assign(delta_dias=dias.dias_recepcion_propuestas_a_fallo)
     histograms = []
     for t, n_bins in [("concurso_abierto", 35), ("invitacion", 20)]:
         data_tipo = data.loc[data.tipo_contratacion == t, ["delta_dias"]].dropna()